@@ -1,29 +1,99 @@
+import os
+import statistics
+import time
+from collections import deque
+
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 import matplotlib.pyplot as plt
 
+from approvisionnement import COUVERTURE, DELAI, matrice_journaliere, planifier
+from audit import FICHIER_AUDIT, JournalAudit
+from boutiques import Boutiques
+from commandes import valider_commande
+from comptes import ROLES, Comptes, Limiteur
+from cubes import INCONNU, Entrepot, rentabilite
+from integrite import ORPHELINE, Integrite
+from nomenclature import UNITES, Nomenclatures
+from previsions import prevoir_tout
+from recherche import Recherche
+from stockage import CANAUX, TABLES, TYPES_CHARGE, TYPES_MATIERE, Magasin
+from synchro import Synchro, lire_tickets
+from taches import Executeur
+from variantes import ajouter_variante, modifier_variante, operations_stock, supprimer_variante, variantes_produit
+
 # ==============================
 # CONFIGURATION
 # ==============================
 st.set_page_config(page_title="Suivi des Caftans", layout="wide")
 
-FICHIER_PRODUITS = "produits.xlsx"
-FICHIER_VENTES = "ventes.xlsx"
-FICHIER_CHARGES = "charges.xlsx"
+DOSSIER_EXPORTS = "exports"
 
-# --- Identifiants utilisateurs ---
-USERS = {
-    "admin": "1234",
-    "abdessamad": "2025"
+# --- Droits par rôle : pages du menu et tables chargées ---
+PAGES = [
+    "🏠 Accueil",
+    "📦 Produits",
+    "🧵 Matières",
+    "🛒 Ventes",
+    "⚡ Caisse",
+    "💰 Charges",
+    "🛍️ Canaux",
+    "📊 Rapports",
+    "🚚 Réapprovisionnement",
+    "⚙️ Tâches",
+    "🛡️ Audit",
+    "🩺 Intégrité",
+    "👥 Utilisateurs",
+]
+DROITS = {
+    "admin": {"pages": PAGES, "tables": {"produits", "ventes", "charges", "commandes", "variantes", "matieres",
+                                         "nomenclatures"}},
+    "comptable": {"pages": ["🏠 Accueil", "📦 Produits", "🧵 Matières", "💰 Charges", "🛍️ Canaux", "📊 Rapports",
+                            "🚚 Réapprovisionnement"],
+                  "tables": {"produits", "ventes", "charges", "variantes", "matieres", "nomenclatures"}},
+    # Le vendeur ne voit ni les coûts ni les charges, qui ne sont donc jamais chargées pour lui
+    "vendeur": {"pages": ["🏠 Accueil", "🛒 Ventes", "⚡ Caisse"], "tables": {"produits", "ventes", "commandes", "variantes"}},
 }
+# Pages disponibles sur la vue consolidée de toutes les boutiques (lecture seule)
+PAGES_CONSOLIDEES = ["🏠 Accueil", "🛍️ Canaux", "📊 Rapports", "👥 Utilisateurs"]
+TOUTES = "*"
+# Suppressions annulables conservées par session
+MAX_ANNULATIONS = 20
 
 # ==============================
 # LOGIN
 # ==============================
+@st.cache_resource
+def comptes():
+    return Comptes()
+
+@st.cache_resource
+def limiteur():
+    return Limiteur()
+
+@st.cache_resource
+def boutiques():
+    return Boutiques()
+
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 
+if not st.session_state.authenticated and comptes().vide:
+    # Premier lancement : aucun compte, on crée l'administrateur
+    st.title("🔑 Création du compte administrateur")
+    with st.form("premier_compte"):
+        username = st.text_input("Nom d'utilisateur", value="admin")
+        password = st.text_input("Mot de passe", type="password")
+        confirmation = st.text_input("Confirmer le mot de passe", type="password")
+        if st.form_submit_button("Créer le compte"):
+            if len(password) < 8 or password != confirmation:
+                st.error("❌ Mot de passe trop court (8 caractères minimum) ou différent de la confirmation")
+            else:
+                comptes().definir(username, password, role="admin")
+                st.rerun()
+    st.stop()
+
 if not st.session_state.authenticated:
     st.title("🔑 Connexion")
 
@@ -32,8 +102,14 @@ if not st.session_state.authenticated:
     login_btn = st.button("Se connecter")
 
     if login_btn:
-        if username in USERS and USERS[username] == password:
+        # La vérification (scrypt) ne tourne qu'ici : ensuite la session reste authentifiée
+        cles = (f"utilisateur:{username}", f"ip:{st.context.ip_address or 'inconnue'}")
+        if not limiteur().autoriser(*cles):
+            st.error(f"⏳ Trop de tentatives, réessayez dans {limiteur().attente(*cles):.0f} s")
+        elif comptes().verifier(username, password):
+            limiteur().reinitialiser(cles[0])
             st.session_state.authenticated = True
+            st.session_state.utilisateur = username
             st.success("✅ Connexion réussie !")
             st.rerun()
         else:
@@ -41,41 +117,382 @@ if not st.session_state.authenticated:
     st.stop()  # Stop ici si non connecté
 
 # ==============================
-# CHARGER LES FICHIERS
+# MAGASIN DE DONNÉES (partagé par toutes les sessions)
+# ==============================
+# Les écritures sont journalisées puis appliquées en mémoire immédiatement ;
+# les fichiers Excel sont réécrits en différé par le magasin.
+@st.cache_resource
+def magasin_boutique(code):
+    m = Magasin(boutiques().dossier(code)).ouvrir()
+    m.abonner(journal_audit_boutique(code).suivre)
+    return m
+
+@st.cache_resource
+def journal_audit_boutique(code):
+    return JournalAudit(os.path.join(boutiques().dossier(code), FICHIER_AUDIT))
+
+utilisateur = st.session_state.get("utilisateur")
+role = comptes().role(utilisateur)
+if role is None:  # compte supprimé pendant que la session était ouverte
+    st.session_state.authenticated = False
+    st.rerun()
+droits = DROITS[role]
+
+# --- Boutique de la session (ou toutes, en lecture consolidée) ---
+codes = [c for c in comptes().boutiques(utilisateur) or boutiques().codes() if c in boutiques().codes()]
+choix_boutiques = codes + ([TOUTES] if len(codes) > 1 and "charges" in droits["tables"] else [])
+boutique = st.sidebar.selectbox(
+    "🏬 Boutique", choix_boutiques,
+    format_func=lambda c: "🌐 Toutes les boutiques" if c == TOUTES else boutiques().nom(c),
+) if len(choix_boutiques) > 1 else choix_boutiques[0]
+consolide = boutique == TOUTES
+if consolide:
+    droits = {"pages": [p for p in droits["pages"] if p in PAGES_CONSOLIDEES], "tables": set()}
+
+def magasin():
+    return magasin_boutique(boutique)
+
+def journal_audit():
+    return journal_audit_boutique(boutique)
+
+def table(nom):
+    # Une table hors des droits du rôle n'est même pas chargée
+    if nom in droits["tables"]:
+        return magasin().df(nom)
+    return pd.DataFrame(columns=TABLES[nom][1])
+
+produits = table("produits")
+ventes = table("ventes")
+charges = table("charges")
+noms_produits = dict(zip(produits["ID"], produits["Nom"]))
+
+# ==============================
+# ENTREPÔT OLAP (cubes pré-agrégés, maintenus à l'écriture)
+# ==============================
+# Un entrepôt par boutique : les écritures d'une boutique ne touchent
+# jamais les agrégats des autres.
+@st.cache_resource
+def etat_entrepot(code):
+    m = magasin_boutique(code)
+    frames, _ = m.instantane()
+    etat = {"entrepot": Entrepot.construire(frames["ventes"], frames["produits"], frames["charges"])}
+    # Chaque écriture du magasin est répercutée par delta sur l'entrepôt courant
+    m.abonner(lambda op, avant, apres: etat["entrepot"].suivre(op["table"], avant, apres, m.df("produits")))
+    return etat
+
+@st.cache_resource
+def etat_consolide():
+    return {"valeur": (None, None)}
+
+@st.cache_resource(max_entries=16)
+def rentabilite_version(code, version_produits, id_entrepot, version_entrepot, _produits, _entrepot):
+    """Indicateurs de rentabilité, recalculés seulement quand les produits ou les ventes changent."""
+    return rentabilite(_produits, _entrepot)
+
+@st.cache_resource(max_entries=16)
+def matrice_version(code, jour, id_entrepot, version_entrepot, _entrepot):
+    """Matrice produits × jours, recalculée seulement quand les ventes ou le jour changent."""
+    return matrice_journaliere(_entrepot, fin=jour)
+
+# --- Catalogue actif ---
+# Les produits archivés restent dans la table (leurs ventes y renvoient) mais
+# sortent du catalogue : sélecteurs de vente, listes et graphiques par
+# produit, réapprovisionnement. Le sous-ensemble actif est calculé une fois
+# par version de la table des produits.
+@st.cache_resource(max_entries=16)
+def catalogue_version(code, version_produits, _produits):
+    actifs = _produits[~_produits["Archivé"].fillna(False).astype(bool)]
+    return {"produits": actifs, "ids": frozenset(actifs["ID"].tolist()),
+            "noms": dict(zip(actifs["ID"], actifs["Nom"]))}
+
+def catalogue_boutique(code):
+    m = magasin_boutique(code)
+    with m.verrou:  # la table et sa version lues ensemble, pas le cadre d'une exécution précédente
+        table_produits = m.df("produits")
+        version = m.versions["produits"]
+    return catalogue_version(code, version, table_produits)
+
+def catalogue():
+    if not consolide:
+        return catalogue_boutique(boutique)
+    # En vue consolidée, les produits sont désignés par leur nom
+    noms = {}
+    for code in codes:
+        noms.update((nom, nom) for nom in catalogue_boutique(code)["noms"].values())
+    return {"produits": produits, "ids": frozenset(noms), "noms": noms}
+
+def entrepot():
+    if not consolide:
+        return etat_entrepot(boutique)["entrepot"]
+    # Consolidation à partir des cubes de chaque boutique, refaite seulement
+    # quand l'un d'eux a changé
+    entrepots = {code: etat_entrepot(code)["entrepot"] for code in codes}
+    cle = tuple((code, id(e), e.version) for code, e in entrepots.items())
+    etat = etat_consolide()
+    if etat["valeur"][0] != cle:
+        noms, noms_variantes = {}, {}
+        for code in codes:
+            p = magasin_boutique(code).df("produits")
+            v = magasin_boutique(code).df("variantes")
+            noms[code] = dict(zip(p["ID"], p["Nom"]))
+            noms_variantes[code] = {0: "Sans variante",
+                                    **dict(zip(v["ID"], v["Produit_ID"].map(noms[code]).astype(str) + " — " + v["Libellé"].astype(str)))}
+        etat["valeur"] = (cle, Entrepot.consolider(entrepots, noms, noms_variantes))
+    return etat["valeur"][1]
+
+# ==============================
+# TÂCHES EN ARRIÈRE-PLAN
+# ==============================
+@st.cache_resource
+def executeur():
+    return Executeur()
+
+def tache_reconstruire_entrepot(tache, code):
+    m = magasin_boutique(code)
+    while True:
+        frames, version = m.instantane()
+        nouveau = Entrepot.construire(frames["ventes"], frames["produits"], frames["charges"],
+                                      avancer=tache.avancer)
+        with m.verrou:
+            # Des écritures pendant le calcul : on recommence sur un instantané à jour
+            if m.version == version:
+                etat_entrepot(code)["entrepot"] = nouveau
+                return "Agrégats reconstruits"
+
+@st.cache_resource
+def integrite_boutique(code):
+    return Integrite(magasin_boutique(code))
+
+@st.cache_resource
+def nomenclatures_boutique(code):
+    return Nomenclatures(magasin_boutique(code))
+
+def tache_verifier_integrite(tache, code):
+    tache.avancer(0.1, "Contrôle de toutes les lignes")
+    return f"{integrite_boutique(code).verifier_tout()} anomalie(s)"
+
+def tache_compacter_magasin(tache, code):
+    tache.avancer(0.1, "Purge des lignes supprimées")
+    purges = magasin_boutique(code).compacter()
+    return f"Lignes purgées : {purges}" if purges else "Rien à compacter"
+
+def tache_vider_magasin(tache, code):
+    tache.avancer(0.1, "Écriture des fichiers Excel")
+    tables = magasin_boutique(code).vider()
+    return f"Tables enregistrées : {', '.join(tables)}" if tables else "Rien à enregistrer"
+
+def tache_exporter_excel(tache, feuilles):
+    os.makedirs(DOSSIER_EXPORTS, exist_ok=True)
+    chemin = os.path.join(DOSSIER_EXPORTS, f"export_{datetime.now():%Y%m%d_%H%M%S}.xlsx")
+    with pd.ExcelWriter(chemin) as classeur:
+        for i, (nom, df) in enumerate(feuilles.items()):
+            tache.avancer(i / len(feuilles), f"Feuille {nom}")
+            df.to_excel(classeur, sheet_name=nom, index=False)
+    return chemin
+
+@st.cache_resource
+def etat_previsions(code):
+    return {"valeur": (None, None)}  # (version de l'entrepôt, prévisions)
+
+def tache_prevoir(tache, code, ent):
+    cle = (id(ent), ent.version)
+    resultat = prevoir_tout(ent, tache.avancer)
+    etat_previsions(code)["valeur"] = (cle, resultat)
+    return f"{len(resultat['previsions'])} séries"
+
+@st.fragment(run_every=1)
+def suivi_taches():
+    actives = executeur().actives()
+    for tache in actives:
+        st.progress(tache.progression, text=f"⏳ {tache.nom} — {tache.message}")
+    if not actives and st.session_state.get("taches_en_cours"):
+        # Une tâche vient de finir : on relance la page pour afficher ses résultats
+        st.session_state.taches_en_cours = False
+        st.rerun()
+    st.session_state.taches_en_cours = bool(actives)
+
+with st.sidebar:
+    suivi_taches()
+
+# ==============================
+# SUPPRESSION ET ANNULATION
+# ==============================
+# Une suppression pose une pierre tombale dans le magasin : la session garde
+# la liste de ses suppressions (lignes supprimées ensemble, mouvements de
+# stock) pour pouvoir les annuler. Une vente et son mouvement de stock
+# sont toujours écrits dans le même lot.
+def variante_de(vente):
+    return 0 if pd.isna(vente["Variante_ID"]) else int(vente["Variante_ID"])
+
+def modifier_vente(vente_id, valeurs):
+    """Modifie une vente et rend / retire le stock de l'ancien et du nouvel article, en un seul lot."""
+    m = magasin()
+    with m.verrou:
+        avant = m.ligne("ventes", vente_id)
+        apres = {**avant.to_dict(), **valeurs}
+        mouvements = {(int(avant["Produit_ID"]), variante_de(avant)): int(avant["Quantité"])}
+        cle = (int(apres["Produit_ID"]), variante_de(apres))
+        mouvements[cle] = mouvements.get(cle, 0) - int(apres["Quantité"])
+        m.ecrire_lot([{"op": "modifier", "table": "ventes", "id": vente_id, "valeurs": valeurs}]
+                     + operations_stock(m, mouvements), par=utilisateur)
+
+def supprimer(nom_table, identifiant, libelle):
+    m = magasin()
+    with m.verrou:
+        operations, mouvements = [{"op": "supprimer", "table": nom_table, "id": identifiant}], {}
+        if nom_table == "ventes":
+            vente = m.ligne("ventes", identifiant)
+            mouvements = {(int(vente["Produit_ID"]), variante_de(vente)): int(vente["Quantité"])}
+            operations += operations_stock(m, mouvements)
+        m.ecrire_lot(operations, par=utilisateur)
+    memoriser_suppression([(nom_table, identifiant)], libelle, mouvements)
+
+def memoriser_suppression(lignes, libelle, mouvements=None):
+    annulations = st.session_state.setdefault("annulations", [])
+    annulations.append((boutique, lignes, libelle, mouvements or {}))
+    del annulations[:-MAX_ANNULATIONS]
+
+# Un produit encore cité par des ventes ne disparaît pas sans décision : on
+# bloque, on l'archive (il sort du catalogue, ses ventes restent) ou on
+# supprime ses ventes avec lui. Le nombre de ventes vient du compteur tenu
+# par le magasin, sans parcourir la table des ventes. Ses variantes et sa
+# nomenclature partent toujours avec lui.
+SUPPRESSION_PRODUIT = {
+    "bloquer": "Bloquer la suppression",
+    "archiver": "Archiver le produit (ses ventes sont conservées)",
+    "cascade": "Supprimer aussi ses ventes",
+}
+
+def supprimer_produit(produit_id, libelle, mode):
+    """Renvoie (réussi, message)."""
+    m = magasin()
+    with m.verrou:
+        nombre = m.compter("ventes", "Produit_ID", produit_id)
+        lignes = [("variantes", int(i)) for i in variantes_produit(m, produit_id)["ID"]]
+        lignes += [("nomenclatures", i) for i in nomenclatures_boutique(boutique).lignes.get(produit_id, {})]
+        if nombre == 0:
+            lignes.append(("produits", produit_id))
+            m.ecrire_lot([{"op": "supprimer", "table": t, "id": i} for t, i in lignes], par=utilisateur)
+            memoriser_suppression([lignes[-1]] + lignes[:-1], libelle)
+            return True, "🗑️ Produit supprimé !"
+        if mode == "bloquer":
+            return False, f"⛔ {nombre} vente(s) référencent ce produit : suppression bloquée."
+        if mode == "archiver":
+            m.modifier("produits", produit_id, {"Archivé": True}, par=utilisateur)
+            return True, f"📦 Produit archivé, ses {nombre} vente(s) sont conservées."
+        ventes = m.df("ventes")
+        lignes += [("ventes", int(i)) for i in ventes.loc[ventes["Produit_ID"] == produit_id, "ID"]]
+        lignes.append(("produits", produit_id))
+        m.ecrire_lot([{"op": "supprimer", "table": t, "id": i} for t, i in lignes], par=utilisateur)
+        memoriser_suppression([lignes[-1]] + lignes[:-1], f"{libelle} et ses {nombre} vente(s)")
+        return True, f"🗑️ Produit et {nombre} vente(s) supprimés !"
+
+annulations = st.session_state.get("annulations", [])
+if annulations:
+    code_annule, lignes, libelle, mouvements = annulations[-1]
+    if st.sidebar.button(f"↩️ Annuler la suppression : {libelle}"):
+        annulations.pop()
+        m = magasin_boutique(code_annule)
+        with m.verrou:
+            restaurable = m.restaurable(*lignes[0])
+            if restaurable:
+                # Produit d'abord : ses ventes restaurées retrouvent leur coût
+                m.ecrire_lot([{"op": "restaurer", "table": t, "id": i} for t, i in lignes if m.restaurable(t, i)]
+                             + operations_stock(m, {cle: -delta for cle, delta in mouvements.items()}),
+                             par=utilisateur)
+        if restaurable:
+            st.rerun()
+        st.sidebar.warning("Trop tard : cette suppression est devenue définitive.")
+
+# ==============================
+# SÉLECTEURS À RECHERCHE
 # ==============================
-def charger_fichier(nom, colonnes):
-    try:
-        df = pd.read_excel(nom)
-        for col in colonnes:
-            if col not in df.columns:
-                df[col] = 0
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame(columns=colonnes)
+# Au lieu d'envoyer toute une table dans une liste déroulante, on n'envoie
+# que les meilleures correspondances de la recherche, ou une page de lignes
+# (les plus récentes d'abord) éventuellement filtrée par date / produit.
+# Un numéro saisi tel quel est résolu directement par l'index des IDs.
+@st.cache_resource
+def synchro_boutique(code):
+    return Synchro(magasin_boutique(code))
+
+@st.cache_resource
+def recherche_boutique(code):
+    return Recherche(magasin_boutique(code))
+
+ETIQUETTES = {
+    "produits": lambda l: f"{l['Nom']} (n° {l['ID']})",
+    "ventes": lambda l: f"n° {l['ID']} — {l['Date']} — {noms_produits.get(l['Produit_ID'], '?')} × {l['Quantité']} ({l['Canal']})",
+    "charges": lambda l: f"n° {l['ID']} — {l['Catégorie']} — {l['Montant']:,.0f} MAD ({l['Date']})",
+}
 
-# Produits
-colonnes_produits = ["ID", "Nom", "Prix vente", "Tissu", "Main-d'œuvre", "Accessoires", "Stock"]
-produits = charger_fichier(FICHIER_PRODUITS, colonnes_produits)
+def filtres_date_produit(cle, par_produit=True):
+    """Filtres facultatifs d'une table datée ; renvoie la fonction qui les applique."""
+    colonnes = st.columns(3 if par_produit else 2)
+    debut = colonnes[0].date_input("Du", value=None, key=f"du_{cle}")
+    fin = colonnes[1].date_input("Au", value=None, key=f"au_{cle}")
+    produit = colonnes[2].text_input("Produit", key=f"produit_{cle}") if par_produit else ""
+    produits_filtres = recherche_boutique(boutique).chercher("produits", produit, 50) if produit else None
 
-# Ventes
-colonnes_ventes = ["ID", "Date", "Produit_ID", "Quantité", "Canal"]
-ventes = charger_fichier(FICHIER_VENTES, colonnes_ventes)
+    def filtrer(df):
+        garder = pd.Series(True, index=df.index)
+        if debut:
+            garder &= df["Date"].astype(str) >= debut.isoformat()
+        if fin:
+            garder &= df["Date"].astype(str) <= fin.isoformat()
+        if produits_filtres is not None:
+            garder &= df["Produit_ID"].isin(produits_filtres)
+        return df[garder]
+    return filtrer
 
-# Charges
-colonnes_charges = ["ID", "Date", "Catégorie", "Montant", "Type"]
-charges = charger_fichier(FICHIER_CHARGES, colonnes_charges)
+def choisir_variante(produit_id, cle, defaut=0):
+    """Choix de la variante d'un produit qui en a ; 0 sinon."""
+    variantes = variantes_produit(magasin(), produit_id) if produit_id is not None else None
+    if variantes is None or variantes.empty:
+        return 0
+    libelles = dict(zip(variantes["ID"].tolist(),
+                        variantes["Libellé"].astype(str) + " (stock " + variantes["Stock"].astype(str) + ")"))
+    ids = list(libelles)
+    return st.selectbox("Variante", ids, index=ids.index(defaut) if defaut in libelles else 0,
+                        key=f"{cle}_{produit_id}", format_func=libelles.get)
+
+def choisir(libelle, nom_table, cle, defaut=None, limite=20, filtrer=None, actifs=False):
+    """Recherche puis choix d'une ligne ; renvoie son ID, ou None si rien ne correspond.
+    Avec `actifs`, seuls les produits du catalogue actif sont proposés."""
+    autorises = catalogue()["ids"] if actifs else None
+    requete = st.text_input(f"🔎 {libelle}", key=f"recherche_{cle}", placeholder="N° ou recherche…").strip()
+    if requete.isdigit() and magasin().ligne(nom_table, int(requete)) is not None and (
+            autorises is None or int(requete) in autorises):
+        ids = [int(requete)]
+    elif requete:
+        if autorises is None:
+            ids = recherche_boutique(boutique).chercher(nom_table, requete, limite)
+        else:
+            ids = [i for i in recherche_boutique(boutique).chercher(nom_table, requete, 5 * limite)
+                   if i in autorises][:limite]
+    else:
+        df = catalogue()["produits"] if actifs else table(nom_table)
+        if filtrer:
+            df = filtrer(df)
+        pages = max(1, -(-len(df) // limite))
+        page = st.number_input(f"Page (sur {pages})", min_value=1, max_value=pages, step=1,
+                               key=f"page_{cle}_{pages}") if pages > 1 else 1  # revient à 1 si le nombre de pages change
+        fin = len(df) - (page - 1) * limite
+        ids = df["ID"].iloc[max(0, fin - limite):fin].tolist()[::-1]
+        if defaut is not None:
+            ids = [defaut] + [i for i in ids if i != defaut]
+    if not ids:
+        st.caption("Aucun résultat.")
+        return None
+    def etiquette(i):
+        ligne = magasin().ligne(nom_table, i)
+        return f"n° {i} (introuvable)" if ligne is None else ETIQUETTES[nom_table](ligne)
+    return st.selectbox(libelle, ids, key=cle, format_func=etiquette)
 
 # ==============================
 # MENU DE NAVIGATION
 # ==============================
-menu = st.sidebar.radio("📌 Navigation", [
-    "🏠 Accueil",
-    "📦 Produits",
-    "🛒 Ventes",
-    "💰 Charges",
-    "📊 Rapports",
-    "🚪 Déconnexion"
-])
+menu = st.sidebar.radio("📌 Navigation", droits["pages"] + ["🚪 Déconnexion"])
+st.sidebar.caption(f"👤 {utilisateur} — {role}")
 
 # ==============================
 # PAGE DECONNEXION
@@ -90,6 +507,27 @@ if menu == "🚪 Déconnexion":
 if menu == "🏠 Accueil":
     st.title("📊 Tableau de bord - Caftans")
 
+    if consolide:
+        # Vue consolidée : tout vient des agrégats des boutiques
+        mensuel = entrepot().synthese("Mois")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Revenu total", f"{mensuel['Revenu'].sum():,.0f} MAD")
+        col2.metric("Coûts production", f"{mensuel['Coût'].sum():,.0f} MAD")
+        col3.metric("Profit brut", f"{mensuel['Marge'].sum():,.0f} MAD")
+        col4.metric("Profit net", f"{mensuel['Profit'].sum():,.0f} MAD")
+        par_boutique = entrepot().ventes.requete({"Boutique": "Boutique"})
+        par_boutique["Boutique"] = par_boutique["Boutique"].map(boutiques().nom)
+        st.dataframe(par_boutique[["Boutique", "Quantité", "Revenu"]])
+        mensuel = mensuel[mensuel["Date"] != INCONNU]
+        if not mensuel.empty:
+            fig, ax = plt.subplots(figsize=(8, 4))
+            ax.plot(mensuel["Date"], mensuel["Revenu"], marker="o")
+            ax.set_title("Revenu mensuel")
+            ax.set_ylabel("MAD")
+            plt.xticks(rotation=45)
+            st.pyplot(fig)
+        st.stop()
+
     if not ventes.empty and not produits.empty:
         ventes_detail = ventes.merge(produits, left_on="Produit_ID", right_on="ID", suffixes=("_vente", "_prod"))
         ventes_detail["Revenu"] = ventes_detail["Quantité"] * ventes_detail["Prix vente"]
@@ -99,23 +537,32 @@ if menu == "🏠 Accueil":
     else:
         ventes_detail = pd.DataFrame(columns=["Revenu", "Cout_prod"])
 
+    if "charges" in droits["tables"]:
+        orphelines = integrite_boutique(boutique).resultats().query("Table == 'ventes' and Contrôle == @ORPHELINE")
+        if not orphelines.empty:
+            st.warning(f"⚠️ {len(orphelines)} vente(s) d'un produit supprimé ne sont pas comptées : "
+                       "voir la page Intégrité.")
+
     revenu_total = ventes_detail["Revenu"].sum()
     cout_total = ventes_detail["Cout_prod"].sum()
     charges_total = charges["Montant"].sum() if not charges.empty else 0
     profit_brut = revenu_total - cout_total
     profit_net = profit_brut - charges_total
 
-    col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Revenu total", f"{revenu_total:,.0f} MAD")
-    col2.metric("Coûts production", f"{cout_total:,.0f} MAD")
-    col3.metric("Profit brut", f"{profit_brut:,.0f} MAD")
-    col4.metric("Profit net", f"{profit_net:,.0f} MAD")
+    if "charges" in droits["tables"]:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Revenu total", f"{revenu_total:,.0f} MAD")
+        col2.metric("Coûts production", f"{cout_total:,.0f} MAD")
+        col3.metric("Profit brut", f"{profit_brut:,.0f} MAD")
+        col4.metric("Profit net", f"{profit_net:,.0f} MAD")
+    else:
+        st.metric("Revenu total", f"{revenu_total:,.0f} MAD")
 
     st.markdown("### 📈 Évolution mensuelle")
     if not ventes.empty:
-        ventes["Date"] = pd.to_datetime(ventes["Date"], errors="coerce")
-        ventes["Mois"] = ventes["Date"].dt.to_period("M").astype(str)
-        resume_mensuel = ventes.merge(produits, left_on="Produit_ID", right_on="ID")
+        # Les tables sont partagées entre sessions : on travaille sur une version dérivée
+        ventes_mois = ventes.assign(Mois=pd.to_datetime(ventes["Date"], errors="coerce").dt.to_period("M").astype(str))
+        resume_mensuel = ventes_mois.merge(produits, left_on="Produit_ID", right_on="ID")
         resume_mensuel["Revenu"] = resume_mensuel["Quantité"] * resume_mensuel["Prix vente"]
         mensuel = resume_mensuel.groupby("Mois")["Revenu"].sum().reset_index()
 
@@ -131,7 +578,11 @@ if menu == "🏠 Accueil":
 # ==============================
 elif menu == "📦 Produits":
     st.title("📦 Produits")
-    st.dataframe(produits)
+    ent = entrepot()
+    tableau = rentabilite_version(boutique, magasin().versions["produits"], id(ent), ent.version, produits, ent)
+    if not st.checkbox("Afficher les produits archivés"):
+        tableau = tableau[tableau["ID"].isin(catalogue()["ids"])]
+    st.dataframe(tableau, hide_index=True)
 
     # --- Ajouter produit ---
     with st.form("ajout_produit"):
@@ -145,44 +596,175 @@ elif menu == "📦 Produits":
         submit = st.form_submit_button("💾 Sauvegarder")
 
         if submit and nom != "":
-            new_id = int(produits["ID"].max()) + 1 if not produits.empty else 1
-            new_row = {"ID": new_id, "Nom": nom, "Prix vente": prix_vente,
-                       "Tissu": tissu, "Main-d'œuvre": mo, "Accessoires": accessoires, "Stock": stock}
-            produits = pd.concat([produits, pd.DataFrame([new_row])], ignore_index=True)
-            produits.to_excel(FICHIER_PRODUITS, index=False)
+            magasin().ajouter("produits", {"Nom": nom, "Prix vente": prix_vente, "Tissu": tissu,
+                                           "Main-d'œuvre": mo, "Accessoires": accessoires, "Stock": stock,
+                                           "Archivé": False},
+                              par=utilisateur)
             st.success("✅ Produit ajouté avec succès !")
             st.rerun()
 
     # --- Modifier / Supprimer produit ---
     if not produits.empty:
         st.subheader("✏️ Modifier ou supprimer un produit")
-        produit_id = st.selectbox("Sélectionner un produit", produits["ID"])
-        produit_sel = produits.loc[produits["ID"] == produit_id].iloc[0]
+        produit_id = choisir("Sélectionner un produit", "produits", "modif_produit_id")
+        if produit_id is not None:
+            produit_sel = magasin().ligne("produits", produit_id)
+            with st.form("modif_produit"):
+                nom = st.text_input("Nom du produit", produit_sel["Nom"])
+                prix_vente = st.number_input("Prix de vente (MAD)", value=float(produit_sel["Prix vente"]), step=100.0)
+                # Avec une nomenclature, tissu et accessoires sont calculés d'après les matières
+                avec_nomenclature = produit_id in nomenclatures_boutique(boutique).lignes
+                aide = "Calculé d'après la nomenclature" if avec_nomenclature else None
+                tissu = st.number_input("Coût tissu (MAD)", value=float(produit_sel["Tissu"]), step=10.0,
+                                        disabled=avec_nomenclature, help=aide)
+                mo = st.number_input("Main-d'œuvre (MAD)", value=float(produit_sel["Main-d'œuvre"]), step=10.0)
+                accessoires = st.number_input("Accessoires (MAD)", value=float(produit_sel["Accessoires"]), step=10.0,
+                                              disabled=avec_nomenclature, help=aide)
+                avec_variantes = bool(magasin().compter("variantes", "Produit_ID", produit_id))
+                stock = st.number_input("Stock disponible", value=int(produit_sel["Stock"]), step=1,
+                                        disabled=avec_variantes,
+                                        help="Somme du stock des variantes" if avec_variantes else None)
+                archive = st.checkbox("Archivé (retiré du catalogue)", value=produit_id not in catalogue()["ids"])
+                nombre_ventes = magasin().compter("ventes", "Produit_ID", produit_id)
+                mode = "bloquer"
+                if nombre_ventes:
+                    mode = st.radio(f"Ce produit est cité par {nombre_ventes} vente(s). À la suppression :",
+                                    list(SUPPRESSION_PRODUIT), format_func=SUPPRESSION_PRODUIT.get)
+
+                col1, col2 = st.columns(2)
+                save = col1.form_submit_button("💾 Mettre à jour")
+                delete = col2.form_submit_button("🗑️ Supprimer")
+
+                if save:
+                    valeurs = {"Nom": nom, "Prix vente": prix_vente, "Tissu": tissu, "Main-d'œuvre": mo,
+                               "Accessoires": accessoires, "Archivé": archive}
+                    # Stock écrit seulement s'il a été saisi : une vente faite depuis l'affichage
+                    # du formulaire garde sa sortie, et le stock d'un produit à variantes leur somme
+                    if not avec_variantes and stock != int(produit_sel["Stock"]):
+                        valeurs["Stock"] = stock
+                    magasin().modifier("produits", produit_id, valeurs, par=utilisateur)
+                    st.success("✅ Produit mis à jour avec succès !")
+                    st.rerun()
 
-        with st.form("modif_produit"):
-            nom = st.text_input("Nom du produit", produit_sel["Nom"])
-            prix_vente = st.number_input("Prix de vente (MAD)", value=float(produit_sel["Prix vente"]), step=100.0)
-            tissu = st.number_input("Coût tissu (MAD)", value=float(produit_sel["Tissu"]), step=10.0)
-            mo = st.number_input("Main-d'œuvre (MAD)", value=float(produit_sel["Main-d'œuvre"]), step=10.0)
-            accessoires = st.number_input("Accessoires (MAD)", value=float(produit_sel["Accessoires"]), step=10.0)
-            stock = st.number_input("Stock disponible", value=int(produit_sel["Stock"]), step=1)
+                if delete:
+                    reussi, message = supprimer_produit(produit_id, f"produit « {produit_sel['Nom']} »", mode)
+                    if not reussi:
+                        st.error(message)
+                    else:
+                        st.warning(message)
+                        st.rerun()
+
+            # --- Nomenclature : matières consommées par une pièce ---
+            st.markdown("**🧵 Nomenclature**")
+            nomenclatures = nomenclatures_boutique(boutique)
+            matieres = table("matieres")
+            noms_matieres = dict(zip(matieres["ID"].tolist(), matieres["Nom"]))
+            lignes = nomenclatures.lignes.get(produit_id, {})
+            if lignes:
+                st.dataframe(pd.DataFrame([
+                    {"ID": i, "Matière": noms_matieres.get(mat, mat), "Quantité": q,
+                     "Unité": UNITES.get(magasin().ligne("matieres", mat)["Type"], "") if mat in noms_matieres else ""}
+                    for i, (mat, q) in lignes.items()]), hide_index=True)
+            if noms_matieres:
+                with st.form("ajout_nomenclature", clear_on_submit=True):
+                    col1, col2 = st.columns(2)
+                    matiere_id = col1.selectbox("Matière", list(noms_matieres), format_func=noms_matieres.get)
+                    quantite = col2.number_input("Quantité par pièce (m ou pièces)", min_value=0.0, step=0.5)
+                    if st.form_submit_button("➕ Ajouter à la nomenclature") and quantite > 0:
+                        nomenclatures.ajouter_ligne(produit_id, matiere_id, quantite, par=utilisateur)
+                        st.rerun()
+            else:
+                st.caption("Ajoutez d'abord des matières dans la page Matières.")
+            if lignes:
+                col1, col2 = st.columns([3, 1])
+                ligne_id = col1.selectbox("Ligne à retirer", list(lignes), format_func=lambda i: (
+                    f"n° {i} — {noms_matieres.get(lignes[i][0], lignes[i][0])} × {lignes[i][1]:g}"))
+                if col2.button("✖️ Retirer la ligne"):
+                    nomenclatures.supprimer_ligne(ligne_id, par=utilisateur)
+                    st.rerun()
+
+            # --- Variantes : même prix et mêmes coûts, stock propre ---
+            st.markdown("**🎨 Variantes**")
+            variantes = variantes_produit(magasin(), produit_id)
+            if not variantes.empty:
+                st.dataframe(variantes[["ID", "Libellé", "Stock"]], hide_index=True)
+            with st.form("ajout_variante", clear_on_submit=True):
+                col1, col2 = st.columns(2)
+                libelle = col1.text_input("Nouvelle variante (taille, couleur…)")
+                stock_variante = col2.number_input("Stock de la variante", min_value=0, step=1)
+                if st.form_submit_button("➕ Ajouter la variante") and libelle:
+                    ajouter_variante(magasin(), produit_id, libelle, int(stock_variante), par=utilisateur)
+                    st.rerun()
+            if not variantes.empty:
+                variante_id = choisir_variante(produit_id, "modif_variante")
+                variante_sel = magasin().ligne("variantes", variante_id)
+                with st.form("modif_variante"):
+                    col1, col2 = st.columns(2)
+                    libelle = col1.text_input("Libellé", variante_sel["Libellé"])
+                    stock_variante = col2.number_input("Stock", value=int(variante_sel["Stock"]), step=1)
+                    col1, col2 = st.columns(2)
+                    if col1.form_submit_button("💾 Mettre à jour la variante"):
+                        modifier_variante(magasin(), variante_id, libelle, int(stock_variante), par=utilisateur)
+                        st.rerun()
+                    if col2.form_submit_button("🗑️ Supprimer la variante"):
+                        nombre = supprimer_variante(magasin(), variante_id, par=utilisateur)
+                        if nombre:
+                            st.error(f"⛔ {nombre} vente(s) citent cette variante : suppression impossible.")
+                        else:
+                            st.rerun()
+
+# ==============================
+# PAGE MATIÈRES
+# ==============================
+elif menu == "🧵 Matières":
+    st.title("🧵 Matières")
+    matieres = table("matieres")
+    nomenclatures = nomenclatures_boutique(boutique)
+    st.dataframe(matieres.assign(**{
+        "Unité": matieres["Type"].map(UNITES),
+        "Produits": [len(nomenclatures.produits.get(i, ())) for i in matieres["ID"].tolist()],
+    }), hide_index=True)
+
+    # --- Ajouter matière ---
+    with st.form("ajout_matiere"):
+        st.subheader("➕ Ajouter une matière")
+        nom = st.text_input("Nom (ex. velours bordeaux, bouton doré)")
+        type_matiere = st.selectbox("Type", TYPES_MATIERE, format_func=lambda t: f"{t} (prix par {UNITES[t]})")
+        prix = st.number_input("Prix unitaire (MAD)", min_value=0.0, step=5.0)
+        if st.form_submit_button("💾 Sauvegarder") and nom != "":
+            magasin().ajouter("matieres", {"Nom": nom, "Type": type_matiere, "Prix unitaire": prix}, par=utilisateur)
+            st.success("✅ Matière ajoutée !")
+            st.rerun()
+
+    # --- Modifier / Supprimer matière : seuls les produits qui l'utilisent sont recalculés ---
+    if not matieres.empty:
+        st.subheader("✏️ Modifier ou supprimer une matière")
+        noms_matieres = dict(zip(matieres["ID"].tolist(), matieres["Nom"]))
+        matiere_id = st.selectbox("Sélectionner une matière", list(noms_matieres),
+                                  format_func=lambda i: f"{noms_matieres[i]} (n° {i})")
+        matiere_sel = magasin().ligne("matieres", matiere_id)
+        with st.form("modif_matiere"):
+            nom = st.text_input("Nom", matiere_sel["Nom"])
+            type_matiere = st.selectbox("Type", TYPES_MATIERE, index=TYPES_MATIERE.index(matiere_sel["Type"])
+                                        if matiere_sel["Type"] in TYPES_MATIERE else 0)
+            prix = st.number_input("Prix unitaire (MAD)", value=float(matiere_sel["Prix unitaire"]), step=5.0)
 
             col1, col2 = st.columns(2)
             save = col1.form_submit_button("💾 Mettre à jour")
             delete = col2.form_submit_button("🗑️ Supprimer")
 
             if save:
-                produits.loc[produits["ID"] == produit_id, ["Nom", "Prix vente", "Tissu",
-                    "Main-d'œuvre", "Accessoires", "Stock"]] = [nom, prix_vente, tissu, mo, accessoires, stock]
-                produits.to_excel(FICHIER_PRODUITS, index=False)
-                st.success("✅ Produit mis à jour avec succès !")
+                recalcules = nomenclatures.modifier_matiere(
+                    matiere_id, {"Nom": nom, "Type": type_matiere, "Prix unitaire": prix}, par=utilisateur)
+                st.success(f"✅ Matière mise à jour, {recalcules} produit(s) recalculé(s) !")
                 st.rerun()
-
             if delete:
-                produits = produits[produits["ID"] != produit_id]
-                produits.to_excel(FICHIER_PRODUITS, index=False)
-                st.warning("🗑️ Produit supprimé !")
-                st.rerun()
+                nombre = nomenclatures.supprimer_matiere(matiere_id, par=utilisateur)
+                if nombre:
+                    st.error(f"⛔ {nombre} produit(s) utilisent cette matière : suppression impossible.")
+                else:
+                    st.warning("🗑️ Matière supprimée !")
+                    st.rerun()
 
 # ==============================
 # PAGE VENTES
@@ -191,50 +773,111 @@ elif menu == "🛒 Ventes":
     st.title("🛒 Ventes")
     st.dataframe(ventes)
 
-    # --- Ajouter vente ---
-    with st.form("ajout_vente"):
-        st.subheader("➕ Ajouter une vente")
-        produit = st.selectbox("Produit", produits["Nom"] if not produits.empty else [])
-        quantite = st.number_input("Quantité", min_value=1, step=1)
-        canal = st.selectbox("Canal", ["Boutique", "En ligne", "Marché"])
-        submit = st.form_submit_button("💾 Sauvegarder")
+    # --- Nouvelle commande : panier de lignes validé en une seule écriture ---
+    st.subheader("🧺 Nouvelle commande")
+    # Un panier par boutique : ses IDs n'ont de sens que dans le magasin où il a été rempli
+    panier = st.session_state.setdefault(f"panier_{boutique}", [])  # [(ID produit, quantité, ID variante)]
+    produit_id = choisir("Produit", "produits", "ajout_vente_produit", actifs=True)
+    variante_id = choisir_variante(produit_id, "ajout_vente_variante")
+    col1, col2 = st.columns(2)
+    quantite = col1.number_input("Quantité", min_value=1, step=1)
+    if col2.button("➕ Ajouter au panier") and produit_id is not None:
+        panier.append((produit_id, int(quantite), variante_id))
+        st.rerun()
 
-        if submit and produit != "":
-            produit_id = produits.loc[produits["Nom"] == produit, "ID"].iloc[0]
-            new_id = int(ventes["ID"].max()) + 1 if not ventes.empty else 1
-            new_row = {"ID": new_id, "Date": datetime.now().strftime("%Y-%m-%d"),
-                       "Produit_ID": produit_id, "Quantité": quantite, "Canal": canal}
-            ventes = pd.concat([ventes, pd.DataFrame([new_row])], ignore_index=True)
-            ventes.to_excel(FICHIER_VENTES, index=False)
-            st.success("✅ Vente enregistrée !")
+    for i, (pid, qte, *variante) in enumerate(panier):
+        col1, col2 = st.columns([4, 1])
+        variante = magasin().ligne("variantes", variante[0]) if variante and variante[0] else None
+        col1.write(f"{noms_produits.get(pid, pid)}{'' if variante is None else ' — ' + variante['Libellé']} × {qte}")
+        if col2.button("✖️", key=f"retirer_ligne_{i}"):
+            panier.pop(i)
             st.rerun()
 
+    if panier:
+        with st.form("valider_commande"):
+            canal = st.selectbox("Canal", CANAUX)
+            client = st.text_input("Client (facultatif)")
+            if st.form_submit_button(f"✅ Valider la commande ({sum(ligne[1] for ligne in panier)} article(s))"):
+                commande_id = valider_commande(magasin(), canal, client, panier, par=utilisateur)
+                panier.clear()
+                st.success(f"✅ Commande n° {commande_id} enregistrée !")
+                st.rerun()
+
     # --- Modifier / Supprimer vente ---
     if not ventes.empty:
         st.subheader("✏️ Modifier ou supprimer une vente")
-        vente_id = st.selectbox("Sélectionner une vente", ventes["ID"])
-        vente_sel = ventes.loc[ventes["ID"] == vente_id].iloc[0]
+        vente_id = choisir("Sélectionner une vente", "ventes", "modif_vente_id",
+                           filtrer=filtres_date_produit("modif_vente_id"))
+        if vente_id is not None:
+            vente_sel = magasin().ligne("ventes", vente_id)
+            produit_id = choisir("Produit de la vente", "produits", f"modif_vente_produit_{vente_id}",
+                                 defaut=vente_sel["Produit_ID"], actifs=True)
+            variante_id = choisir_variante(produit_id, f"modif_vente_variante_{vente_id}", variante_de(vente_sel))
+            with st.form("modif_vente"):
+                quantite = st.number_input("Quantité", value=int(vente_sel["Quantité"]), step=1)
+                canal = st.selectbox("Canal", CANAUX, index=CANAUX.index(vente_sel["Canal"]) if vente_sel["Canal"] in CANAUX else 0)
+
+                col1, col2 = st.columns(2)
+                save = col1.form_submit_button("💾 Mettre à jour")
+                delete = col2.form_submit_button("🗑️ Supprimer")
+
+                if save and produit_id is not None:
+                    modifier_vente(vente_id, {"Produit_ID": produit_id, "Quantité": quantite, "Canal": canal,
+                                              "Variante_ID": variante_id})
+                    st.success("✅ Vente mise à jour !")
+                    st.rerun()
 
-        with st.form("modif_vente"):
-            produit_id = st.selectbox("Produit", produits["ID"], index=produits[produits["ID"] == vente_sel["Produit_ID"]].index[0])
-            quantite = st.number_input("Quantité", value=int(vente_sel["Quantité"]), step=1)
-            canal = st.selectbox("Canal", ["Boutique", "En ligne", "Marché"], index=["Boutique", "En ligne", "Marché"].index(vente_sel["Canal"]))
+                if delete:
+                    supprimer("ventes", vente_id, f"vente n° {vente_id}")
+                    st.warning("🗑️ Vente supprimée !")
+                    st.rerun()
 
+# ==============================
+# PAGE CAISSE (saisie rapide)
+# ==============================
+elif menu == "⚡ Caisse":
+    st.title("⚡ Caisse")
+
+    # Fragment : une saisie ne réexécute que ce bloc, sans tableau ni formulaire d'édition
+    @st.fragment
+    def caisse():
+        latences = st.session_state.setdefault("latences_caisse", deque(maxlen=100))
+        produit_id = choisir("Produit", "produits", "caisse_produit", limite=10, actifs=True)
+        variante_id = choisir_variante(produit_id, "caisse_variante")
+        with st.form("caisse", clear_on_submit=True):
             col1, col2 = st.columns(2)
-            save = col1.form_submit_button("💾 Mettre à jour")
-            delete = col2.form_submit_button("🗑️ Supprimer")
+            quantite = col1.number_input("Quantité", min_value=1, step=1)
+            canal = col2.selectbox("Canal", CANAUX)
+            if st.form_submit_button("💾 Encaisser", type="primary") and produit_id is not None:
+                debut = time.perf_counter()
+                commande_id = valider_commande(magasin(), canal, "", [(produit_id, int(quantite), variante_id)],
+                                               par=utilisateur)
+                latences.append(time.perf_counter() - debut)
+                st.success(f"✅ {noms_produits.get(produit_id, produit_id)} × {quantite} — commande n° {commande_id}")
+        if latences:
+            ordonnees = sorted(latences)
+            st.caption(f"Enregistrement : médiane {statistics.median(ordonnees) * 1000:.1f} ms, "
+                       f"95 % sous {ordonnees[int(0.95 * (len(ordonnees) - 1))] * 1000:.1f} ms "
+                       f"({len(ordonnees)} dernières saisies)")
 
-            if save:
-                ventes.loc[ventes["ID"] == vente_id, ["Produit_ID", "Quantité", "Canal"]] = [produit_id, quantite, canal]
-                ventes.to_excel(FICHIER_VENTES, index=False)
-                st.success("✅ Vente mise à jour !")
-                st.rerun()
+    caisse()
 
-            if delete:
-                ventes = ventes[ventes["ID"] != vente_id]
-                ventes.to_excel(FICHIER_VENTES, index=False)
-                st.warning("🗑️ Vente supprimée !")
-                st.rerun()
+    # --- Tickets saisis hors ligne au stand (capture.py) ---
+    st.subheader("📥 Ventes saisies hors ligne")
+    st.caption(f"Lots déposés dans « {os.path.join(magasin().dossier, 'reception')} » ou envoyés ici ; "
+               "un ticket déjà importé est ignoré.")
+    lots = st.file_uploader("Lots de tickets (.jsonl)", type="jsonl", accept_multiple_files=True)
+    if st.button("🔄 Synchroniser"):
+        resultats = [synchro_boutique(boutique).importer(lire_tickets(lot.getvalue().decode("utf-8")), par=utilisateur)
+                     for lot in lots or []]
+        resultats.append(synchro_boutique(boutique).importer_reception(par=utilisateur))
+        importes = sum(r[0] for r in resultats)
+        doublons = sum(r[1] for r in resultats)
+        rejetes = [t for r in resultats for t in r[2]]
+        st.success(f"✅ {importes} ticket(s) importé(s), {doublons} doublon(s) ignoré(s)")
+        if rejetes:
+            st.error(f"❌ {len(rejetes)} ticket(s) rejeté(s) (produit inconnu)")
+            st.json(rejetes)
 
 # ==============================
 # PAGE CHARGES
@@ -248,70 +891,354 @@ elif menu == "💰 Charges":
         st.subheader("➕ Ajouter une charge")
         categorie = st.text_input("Catégorie (Marketing, Loyer, etc.)")
         montant = st.number_input("Montant (MAD)", min_value=0.0, step=100.0)
-        type_charge = st.selectbox("Type", ["Fixe", "Variable"])
+        type_charge = st.selectbox("Type", TYPES_CHARGE)
         submit = st.form_submit_button("💾 Sauvegarder")
 
         if submit and categorie != "":
-            new_id = int(charges["ID"].max()) + 1 if not charges.empty else 1
-            new_row = {"ID": new_id, "Date": datetime.now().strftime("%Y-%m-%d"),
-                       "Catégorie": categorie, "Montant": montant, "Type": type_charge}
-            charges = pd.concat([charges, pd.DataFrame([new_row])], ignore_index=True)
-            charges.to_excel(FICHIER_CHARGES, index=False)
+            magasin().ajouter("charges", {"Date": datetime.now().strftime("%Y-%m-%d"),
+                                          "Catégorie": categorie, "Montant": montant, "Type": type_charge},
+                              par=utilisateur)
             st.success("✅ Charge ajoutée !")
             st.rerun()
 
     # --- Modifier / Supprimer charge ---
     if not charges.empty:
         st.subheader("✏️ Modifier ou supprimer une charge")
-        charge_id = st.selectbox("Sélectionner une charge", charges["ID"])
-        charge_sel = charges.loc[charges["ID"] == charge_id].iloc[0]
+        charge_id = choisir("Sélectionner une charge", "charges", "modif_charge_id",
+                            filtrer=filtres_date_produit("modif_charge_id", par_produit=False))
+        if charge_id is not None:
+            charge_sel = magasin().ligne("charges", charge_id)
+            with st.form("modif_charge"):
+                categorie = st.text_input("Catégorie", charge_sel["Catégorie"])
+                montant = st.number_input("Montant (MAD)", value=float(charge_sel["Montant"]), step=100.0)
+                type_charge = st.selectbox("Type", TYPES_CHARGE, index=TYPES_CHARGE.index(charge_sel["Type"]) if charge_sel["Type"] in TYPES_CHARGE else 0)
 
-        with st.form("modif_charge"):
-            categorie = st.text_input("Catégorie", charge_sel["Catégorie"])
-            montant = st.number_input("Montant (MAD)", value=float(charge_sel["Montant"]), step=100.0)
-            type_charge = st.selectbox("Type", ["Fixe", "Variable"], index=["Fixe", "Variable"].index(charge_sel["Type"]))
+                col1, col2 = st.columns(2)
+                save = col1.form_submit_button("💾 Mettre à jour")
+                delete = col2.form_submit_button("🗑️ Supprimer")
 
-            col1, col2 = st.columns(2)
-            save = col1.form_submit_button("💾 Mettre à jour")
-            delete = col2.form_submit_button("🗑️ Supprimer")
+                if save:
+                    magasin().modifier("charges", charge_id, {"Catégorie": categorie, "Montant": montant, "Type": type_charge},
+                                       par=utilisateur)
+                    st.success("✅ Charge mise à jour !")
+                    st.rerun()
 
-            if save:
-                charges.loc[charges["ID"] == charge_id, ["Catégorie", "Montant", "Type"]] = [categorie, montant, type_charge]
-                charges.to_excel(FICHIER_CHARGES, index=False)
-                st.success("✅ Charge mise à jour !")
-                st.rerun()
+                if delete:
+                    supprimer("charges", charge_id, f"charge n° {charge_id}")
+                    st.warning("🗑️ Charge supprimée !")
+                    st.rerun()
 
-            if delete:
-                charges = charges[charges["ID"] != charge_id]
-                charges.to_excel(FICHIER_CHARGES, index=False)
-                st.warning("🗑️ Charge supprimée !")
-                st.rerun()
+# ==============================
+# PAGE CANAUX
+# ==============================
+elif menu == "🛍️ Canaux":
+    st.title("🛍️ Canaux de vente")
+    cube = entrepot().ventes
+
+    # En vue consolidée, les produits sont déjà désignés par leur nom
+    noms = noms_produits or {k: k for k in cube.requete({"Produit": "Produit"})["Produit"]}
+    mois_dispo = cube.requete({"Date": "Mois"})["Date"].tolist()
+    col1, col2, col3 = st.columns(3)
+    mois = col1.selectbox("Mois", ["Tous"] + mois_dispo)
+    produit_id = col2.selectbox("Produit", ["Tous"] + list(catalogue()["noms"]), format_func=lambda i: noms.get(i, i))
+    axe = col3.selectbox("Regrouper par", ["Canal", "Mois", "Produit"])
+
+    niveaux = {"Canal": "Canal"}
+    if axe == "Mois":
+        niveaux["Date"] = "Mois"
+    elif axe == "Produit":
+        niveaux["Produit"] = "Produit"
+    filtres = {}
+    if mois != "Tous":
+        filtres["Date"] = ("Mois", mois)
+    if produit_id != "Tous":
+        filtres["Produit"] = ("Produit", produit_id)
+    resultat = cube.requete(niveaux, filtres)
+
+    if resultat.empty:
+        st.info("Aucune vente pour cette sélection.")
+    else:
+        resultat["Marge"] = resultat["Revenu"] - resultat["Coût"]
+        if "Produit" in resultat:
+            resultat["Produit"] = resultat["Produit"].map(noms)
+        resultat = resultat.rename(columns={"Date": "Mois"})
+        st.dataframe(resultat)
+
+        if axe == "Canal":
+            fig, ax = plt.subplots(figsize=(8, 4))
+            ax.bar(resultat["Canal"], resultat["Revenu"], label="Revenu")
+            ax.bar(resultat["Canal"], resultat["Marge"], label="Marge")
+            ax.set_title("Revenu et marge par canal")
+            ax.set_ylabel("MAD")
+            ax.legend()
+            st.pyplot(fig)
+        else:
+            pivot = resultat.pivot_table(index=axe, columns="Canal", values="Revenu", aggfunc="sum").fillna(0)
+            fig, ax = plt.subplots(figsize=(8, 4))
+            pivot.plot(kind="bar", stacked=True, ax=ax)
+            ax.set_title(f"Revenu par canal et par {axe.lower()}")
+            ax.set_ylabel("MAD")
+            plt.xticks(rotation=45)
+            st.pyplot(fig)
 
 # ==============================
 # PAGE RAPPORTS
 # ==============================
 elif menu == "📊 Rapports":
     st.title("📊 Rapports & Statistiques")
+    ent = entrepot()
 
-    if not ventes.empty and not produits.empty:
-        ventes_detail = ventes.merge(produits, left_on="Produit_ID", right_on="ID")
-        ventes_detail["Revenu"] = ventes_detail["Quantité"] * ventes_detail["Prix vente"]
+    # --- Drill-down temporel : Année → Mois → Semaine → Jour ---
+    st.subheader("🔎 Synthèse par période")
+    col1, col2, col3 = st.columns(3)
+    niveau = col1.selectbox("Niveau", ["Année", "Mois", "Semaine", "Jour"])
+    annees = ent.synthese("Année")["Date"].tolist()
+    annee = col2.selectbox("Année", ["Toutes"] + annees)
+    filtre_date = None if annee == "Toutes" else ("Année", annee)
+    if niveau in ("Semaine", "Jour") and filtre_date:
+        mois_annee = ent.synthese("Mois", filtre_date)["Date"].tolist()
+        mois = col3.selectbox("Mois", ["Tous"] + mois_annee)
+        if mois != "Tous":
+            filtre_date = ("Mois", mois)
 
-        st.subheader("🏆 Top produits par revenu")
-        top_produits = ventes_detail.groupby("Nom")["Revenu"].sum().sort_values(ascending=False).reset_index()
-        st.dataframe(top_produits)
+    synthese = ent.synthese(niveau, filtre_date)
+    st.dataframe(synthese)
 
-        fig, ax = plt.subplots(figsize=(8,4))
-        ax.bar(top_produits["Nom"], top_produits["Revenu"])
-        ax.set_title("Revenu par produit")
-        ax.set_ylabel("MAD")
+    # --- Ventilation de la période par dimension ---
+    axes = ["Produit", "Variante", "Canal", "Catégorie de charge"] + (["Boutique"] if consolide else [])
+    axe = st.selectbox("Ventiler par", axes)
+    filtres = {"Date": filtre_date} if filtre_date else None
+    noms = noms_produits or {k: k for k in ent.ventes.requete({"Produit": "Produit"})["Produit"]}
+    if axe == "Catégorie de charge":
+        ventilation = ent.charges.requete({"Catégorie": "Catégorie"}, filtres)
+        if not ventilation.empty:
+            fig, ax = plt.subplots()
+            ax.pie(ventilation["Charges"], labels=ventilation["Catégorie"], autopct='%1.1f%%')
+            ax.set_title("Répartition des charges")
+            st.pyplot(fig)
+    else:
+        ventilation = ent.ventes.requete({axe: axe}, filtres)
+        ventilation["Marge"] = ventilation["Revenu"] - ventilation["Coût"]
+        ventilation = ventilation.sort_values("Revenu", ascending=False)
+        if axe == "Produit":
+            if not st.checkbox("Inclure les produits archivés", key="ventilation_archives"):
+                ventilation = ventilation[ventilation["Produit"].isin(catalogue()["ids"])]
+            ventilation["Produit"] = ventilation["Produit"].map(noms)
+        elif axe == "Variante":
+            # En vue consolidée, les variantes sont déjà désignées par leur nom
+            variantes = table("variantes")
+            libelles = dict(zip(variantes["ID"], variantes["Produit_ID"].map(noms_produits).astype(str) + " — "
+                                + variantes["Libellé"].astype(str)))
+            ventilation["Variante"] = ventilation["Variante"].map(
+                lambda v: "Sans variante" if v == 0 else libelles.get(v, v))
+        elif axe == "Boutique":
+            ventilation["Boutique"] = ventilation["Boutique"].map(boutiques().nom)
+        if not ventilation.empty:
+            fig, ax = plt.subplots(figsize=(8, 4))
+            ax.bar(ventilation[axe].astype(str), ventilation["Revenu"])
+            ax.set_title(f"Revenu par {axe.lower()}")
+            ax.set_ylabel("MAD")
+            plt.xticks(rotation=45)
+            st.pyplot(fig)
+    st.dataframe(ventilation)
+
+    # --- Prévisions, recalculées en arrière-plan à chaque nouvelle version des données ---
+    st.subheader("🔮 Prévisions")
+    cle, resultat = etat_previsions(boutique)["valeur"]
+    if cle != (id(ent), ent.version):
+        nom_boutique = "Toutes les boutiques" if consolide else boutiques().nom(boutique)
+        executeur().soumettre(f"Prévisions — {nom_boutique}", tache_prevoir, boutique, ent)
+    if resultat is None:
+        st.info("⏳ Calcul des prévisions en cours…")
+    elif not resultat["previsions"]:
+        st.info("Pas encore de ventes datées à prolonger.")
+    else:
+        if cle != (id(ent), ent.version):
+            st.caption("Prévisions calculées sur les données précédentes ; mise à jour en cours.")
+        serie = st.selectbox("Série", list(resultat["previsions"]),
+                             format_func=lambda k: "Revenu total" if k == "Total" else f"Quantité — {noms.get(k, k)}")
+        historique, prevision = resultat["historique"][serie], resultat["previsions"][serie]
+        fig, ax = plt.subplots(figsize=(8, 4))
+        ax.plot(historique.index, historique.to_numpy(), marker="o", label="Historique")
+        ax.plot(prevision["mois"], prevision["prevision"], marker="o", linestyle="--", label="Prévision")
+        ax.set_title(f"{prevision['methode']} (erreur type : {prevision['erreur']:,.1f})")
+        ax.legend()
         plt.xticks(rotation=45)
         st.pyplot(fig)
+        st.dataframe(pd.DataFrame({"Mois": prevision["mois"], "Prévision": prevision["prevision"].round(1)}),
+                     hide_index=True)
 
-    if not charges.empty:
-        st.subheader("📌 Répartition des charges")
-        charges_par_cat = charges.groupby("Catégorie")["Montant"].sum().reset_index()
-        fig, ax = plt.subplots()
-        ax.pie(charges_par_cat["Montant"], labels=charges_par_cat["Catégorie"], autopct='%1.1f%%')
-        ax.set_title("Répartition des charges")
-        st.pyplot(fig)
+# ==============================
+# PAGE RÉAPPROVISIONNEMENT
+# ==============================
+elif menu == "🚚 Réapprovisionnement":
+    st.title("🚚 Réapprovisionnement")
+    col1, col2 = st.columns(2)
+    delai = col1.number_input("Délai de réapprovisionnement (jours)", min_value=1, value=DELAI, step=1)
+    couverture = col2.number_input("Couverture visée après livraison (jours)", min_value=1, value=COUVERTURE, step=1)
+    ent = entrepot()
+    matrice = matrice_version(boutique, datetime.now().strftime("%Y-%m-%d"), id(ent), ent.version, ent)
+    plan = planifier(catalogue()["produits"], matrice, delai, couverture)
+    alertes = plan[plan["À commander"] > 0]
+    st.metric("Produits à commander", len(alertes))
+    st.dataframe(plan, hide_index=True)
+
+# ==============================
+# PAGE TÂCHES
+# ==============================
+elif menu == "⚙️ Tâches":
+    st.title("⚙️ Tâches en arrière-plan")
+
+    en_attente = sorted(magasin().sales)
+    st.caption(f"Modifications en attente d'écriture Excel : {', '.join(en_attente)}" if en_attente
+               else "Fichiers Excel à jour.")
+    memoire = magasin().memoire()
+    st.caption(f"Données en mémoire, partagées par toutes les sessions : {sum(memoire.values()) / 2 ** 20:.1f} Mo ("
+               + ", ".join(f"{nom} {octets / 2 ** 20:.1f} Mo" for nom, octets in sorted(memoire.items())) + ")")
+
+    col1, col2, col3, col4 = st.columns(4)
+    nom_boutique = boutiques().nom(boutique)
+    if col3.button("💾 Enregistrer maintenant"):
+        executeur().soumettre(f"Enregistrer les fichiers Excel — {nom_boutique}", tache_vider_magasin, boutique)
+        st.rerun()
+    if col4.button("🧹 Compacter"):
+        executeur().soumettre(f"Compacter les suppressions — {nom_boutique}", tache_compacter_magasin, boutique)
+        st.rerun()
+    if col1.button("🔄 Reconstruire les agrégats"):
+        executeur().soumettre(f"Reconstruire les agrégats — {nom_boutique}", tache_reconstruire_entrepot, boutique)
+        st.rerun()
+    if col2.button("📤 Exporter en Excel"):
+        ent = entrepot()
+        executeur().soumettre(f"Export Excel — {nom_boutique}", tache_exporter_excel, {
+            # Versions immuables du magasin : inutile de les copier
+            "Produits": produits,
+            "Ventes": ventes,
+            "Charges": charges,
+            "Commandes": table("commandes"),
+            "Variantes": table("variantes"),
+            "Matières": table("matieres"),
+            "Nomenclatures": table("nomenclatures"),
+            "Synthèse mensuelle": ent.synthese("Mois"),
+        })
+        st.rerun()
+
+    for tache in executeur().recentes():
+        with st.container(border=True):
+            st.markdown(f"**{tache.nom}** — {tache.etat}")
+            if tache.active:
+                st.progress(tache.progression, text=tache.message)
+            elif tache.erreur:
+                st.error(tache.message)
+            elif tache.resultat and str(tache.resultat).endswith(".xlsx") and os.path.exists(tache.resultat):
+                with open(tache.resultat, "rb") as f:
+                    st.download_button("⬇️ Télécharger", f.read(), file_name=os.path.basename(tache.resultat),
+                                       key=f"telecharger_{tache.id}")
+            elif tache.resultat:
+                st.caption(str(tache.resultat))
+
+# ==============================
+# PAGE AUDIT
+# ==============================
+elif menu == "🛡️ Audit":
+    st.title("🛡️ Journal d'audit")
+    audit = journal_audit()
+
+    col1, col2, col3 = st.columns(3)
+    table_audit = col1.selectbox("Table", ["Toutes"] + list(TABLES))
+    ligne_id = col2.number_input("ID de la ligne (0 = toutes)", min_value=0, step=1)
+    auteur = col3.selectbox("Utilisateur", ["Tous"] + audit.utilisateurs())
+    col1, col2, col3 = st.columns(3)
+    depuis = col1.date_input("Depuis", value=None)
+    jusqu_a = col2.date_input("Jusqu'au", value=None)
+    page = col3.number_input("Page", min_value=1, step=1)
+
+    taille_page = 50
+    entrees = audit.rechercher(
+        table=None if table_audit == "Toutes" else table_audit,
+        ligne_id=ligne_id or None,
+        utilisateur=None if auteur == "Tous" else auteur,
+        depuis=depuis.isoformat() if depuis else None,
+        jusqu_a=(pd.Timestamp(jusqu_a) + pd.Timedelta(days=1)).date().isoformat() if jusqu_a else None,
+        limite=taille_page,
+        decalage=(page - 1) * taille_page,
+    )
+    if entrees.empty:
+        st.info("Aucune entrée pour ces critères.")
+    else:
+        st.dataframe(entrees, hide_index=True)
+
+# ==============================
+# PAGE INTÉGRITÉ
+# ==============================
+elif menu == "🩺 Intégrité":
+    st.title("🩺 Intégrité des données")
+    integrite = integrite_boutique(boutique)
+    resultats = integrite.resultats()
+    st.caption(f"Suivi à chaque écriture ; dernière vérification complète : {integrite.derniere_verification}")
+    if st.button("🔍 Vérification complète"):
+        executeur().soumettre(f"Vérification de l'intégrité — {boutiques().nom(boutique)}",
+                              tache_verifier_integrite, boutique)
+        st.rerun()
+
+    if resultats.empty:
+        st.success("✅ Aucune anomalie.")
+    else:
+        par_controle = resultats.groupby(["Table", "Contrôle"]).size().reset_index(name="Lignes")
+        colonnes = st.columns(min(4, len(par_controle)))
+        for i, (table_nom, controle, lignes) in enumerate(par_controle.itertuples(index=False)):
+            colonnes[i % len(colonnes)].metric(f"{controle} ({table_nom})", lignes)
+        choix = st.multiselect("Contrôles", par_controle["Contrôle"].unique().tolist())
+        st.dataframe(resultats[resultats["Contrôle"].isin(choix)] if choix else resultats, hide_index=True)
+
+# ==============================
+# PAGE UTILISATEURS
+# ==============================
+elif menu == "👥 Utilisateurs":
+    st.title("👥 Utilisateurs")
+    noms = comptes().noms()
+    st.dataframe(pd.DataFrame({
+        "Nom": noms,
+        "Rôle": [comptes().role(n) for n in noms],
+        "Boutiques": [", ".join(comptes().boutiques(n) or ["toutes"]) for n in noms],
+    }), hide_index=True)
+
+    with st.form("compte"):
+        st.subheader("➕ Créer un compte ou le modifier")
+        nom = st.text_input("Nom d'utilisateur")
+        mot_de_passe = st.text_input("Mot de passe (vide = inchangé pour un compte existant)", type="password")
+        role_compte = st.selectbox("Rôle", ROLES)
+        boutiques_compte = st.multiselect("Boutiques (aucune = toutes)", boutiques().codes(),
+                                          format_func=boutiques().nom)
+        if st.form_submit_button("💾 Enregistrer") and nom:
+            if (mot_de_passe or nom not in noms) and len(mot_de_passe) < 8:
+                st.error("❌ 8 caractères minimum")
+            elif nom == utilisateur and role_compte != "admin":
+                st.error("❌ Vous ne pouvez pas retirer votre propre rôle administrateur")
+            else:
+                comptes().definir(nom, mot_de_passe or None, role=role_compte, boutiques=boutiques_compte or None)
+                st.success("✅ Compte enregistré !")
+                st.rerun()
+
+    autres = [n for n in comptes().noms() if n != utilisateur]
+    if autres:
+        st.subheader("🗑️ Supprimer un compte")
+        nom = st.selectbox("Compte", autres)
+        if st.button("🗑️ Supprimer le compte"):
+            comptes().supprimer(nom)
+            st.warning("🗑️ Compte supprimé !")
+            st.rerun()
+
+    with st.form("boutique"):
+        st.subheader("🏬 Ajouter une boutique")
+        code = st.text_input("Code (lettres, chiffres, tirets)")
+        nom_boutique = st.text_input("Nom affiché")
+        if st.form_submit_button("➕ Ajouter") and code:
+            if not code.replace("-", "").isalnum():
+                st.error("❌ Code invalide")
+            else:
+                try:
+                    boutiques().ajouter(code, nom_boutique or code)
+                    st.success("✅ Boutique ajoutée !")
+                    st.rerun()
+                except ValueError as exc:
+                    st.error(f"❌ {exc}")
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cubes import INCONNU
+
+# ==============================
+# PLANIFICATION DU RÉAPPROVISIONNEMENT
+# ==============================
+# Tout part d'une matrice produits × jours des quantités vendues sur une
+# fenêtre récente, lue dans le cuboïde (Jour, Produit) de l'entrepôt. La
+# vitesse de vente, sa dispersion, les jours de couverture et les points de
+# commande de tous les produits sont ensuite calculés en une passe NumPy.
+
+FENETRE = 90  # jours d'historique pris en compte
+DELAI = 14  # jours entre la commande et la mise en rayon
+COUVERTURE = 30  # jours de ventes que doit couvrir une commande
+Z_SECURITE = 1.65  # ~95 % de chances de ne pas tomber en rupture pendant le délai
+
+
+def matrice_journaliere(entrepot, fenetre=FENETRE, fin=None):
+    """Quantités vendues par produit (lignes) et par jour (colonnes, jours sans vente à 0)."""
+    fin = pd.Timestamp(fin or datetime.now()).normalize()
+    jours = pd.date_range(end=fin, periods=fenetre, freq="D").strftime("%Y-%m-%d")
+    df = entrepot.ventes.requete({"Date": "Jour", "Produit": "Produit"})
+    df = df[(df["Date"] != INCONNU) & df["Date"].between(jours[0], jours[-1])]
+    return df.pivot_table(index="Produit", columns="Date", values="Quantité", aggfunc="sum", fill_value=0) \
+        .reindex(columns=jours, fill_value=0)
+
+
+def planifier(produits, matrice, delai=DELAI, couverture=COUVERTURE, z=Z_SECURITE):
+    """Vitesse de vente, couverture et point de commande de chaque produit.
+
+    Point de commande = demande moyenne pendant le délai + stock de sécurité
+    (z × écart-type journalier × √délai). Un produit sous son point de commande
+    est signalé, avec la quantité qui le remonte à `couverture` jours après le délai.
+    """
+    ventes = matrice.reindex(produits["ID"], fill_value=0).to_numpy(dtype=float)
+    if ventes.shape[1] == 0:
+        ventes = np.zeros((len(produits), 1))
+    stock = produits["Stock"].fillna(0).to_numpy(dtype=float)
+    vitesse = ventes.mean(axis=1)
+    ecart = ventes.std(axis=1)
+    point = np.ceil(vitesse * delai + z * ecart * np.sqrt(delai))
+    with np.errstate(divide="ignore"):
+        jours = np.where(vitesse > 0, stock / vitesse, np.inf)
+    commande = np.maximum(0, np.ceil(vitesse * (delai + couverture) + z * ecart * np.sqrt(delai) - stock))
+    plan = pd.DataFrame({
+        "ID": produits["ID"].to_numpy(),
+        "Nom": produits["Nom"].to_numpy(),
+        "Stock": stock,
+        "Ventes / jour": vitesse.round(2),
+        "Jours de couverture": np.round(jours, 1),
+        "Point de commande": point,
+        "À commander": np.where(stock <= point, commande, 0),
+        "Alerte": np.where(stock <= 0, "🔴 Rupture", np.where(stock <= point, "🟠 Commander", "🟢")),
+    })
+    return plan.sort_values("Jours de couverture").reset_index(drop=True)
@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import threading
+
+import pandas as pd
+
+from stockage import valeur_json
+
+# ==============================
+# JOURNAL D'AUDIT
+# ==============================
+# Trace en ajout seul de chaque ajout / modification / suppression :
+# qui, quand, quelle table, quelle ligne, valeurs avant et après.
+# Stocké dans une base SQLite indexée par (table, ligne, date) et par date,
+# pour que la page d'administration ne lise que la page demandée.
+# Pour une modification, seuls les champs changés sont conservés.
+
+FICHIER_AUDIT = "audit.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit (
+    id INTEGER PRIMARY KEY,
+    horodatage TEXT NOT NULL,
+    utilisateur TEXT,
+    table_nom TEXT NOT NULL,
+    ligne_id INTEGER,
+    action TEXT NOT NULL,
+    avant TEXT,
+    apres TEXT
+);
+CREATE INDEX IF NOT EXISTS audit_ligne ON audit (table_nom, ligne_id, horodatage);
+CREATE INDEX IF NOT EXISTS audit_date ON audit (horodatage);
+CREATE INDEX IF NOT EXISTS audit_utilisateur ON audit (utilisateur, horodatage);
+"""
+
+
+def en_dict(ligne):
+    return None if ligne is None else {k: valeur_json(v) for k, v in ligne.items()}
+
+
+def compact(valeurs):
+    return None if valeurs is None else json.dumps(valeurs, ensure_ascii=False, separators=(",", ":"))
+
+
+class JournalAudit:
+    def __init__(self, chemin=FICHIER_AUDIT):
+        self.connexion = sqlite3.connect(chemin, check_same_thread=False)
+        self.connexion.execute("PRAGMA journal_mode=WAL")
+        self.connexion.execute("PRAGMA synchronous=NORMAL")
+        self.connexion.executescript(SCHEMA)
+        self.verrou = threading.Lock()
+
+    def suivre(self, operation, avant, apres):
+        """Abonné du magasin : enregistre l'écriture décrite par `operation`."""
+        avant, apres = en_dict(avant), en_dict(apres)
+        if avant is not None and apres is not None:
+            changes = [k for k in apres if avant.get(k) != apres[k]]
+            if not changes:
+                return
+            avant = {k: avant.get(k) for k in changes}
+            apres = {k: apres[k] for k in changes}
+        self.enregistrer(operation["ts"], operation["par"], operation["table"], operation["id"],
+                         operation["op"], avant, apres)
+
+    def enregistrer(self, horodatage, utilisateur, table, ligne_id, action, avant, apres):
+        with self.verrou, self.connexion:
+            self.connexion.execute(
+                "INSERT INTO audit (horodatage, utilisateur, table_nom, ligne_id, action, avant, apres) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (horodatage, utilisateur, table, ligne_id, action, compact(avant), compact(apres)),
+            )
+
+    def rechercher(self, table=None, ligne_id=None, utilisateur=None, depuis=None, jusqu_a=None,
+                   limite=50, decalage=0):
+        """Entrées les plus récentes d'abord, filtrées et paginées côté SQLite."""
+        conditions, parametres = [], []
+        for colonne, operateur, valeur in (
+            ("table_nom", "=", table),
+            ("ligne_id", "=", ligne_id),
+            ("utilisateur", "=", utilisateur),
+            ("horodatage", ">=", depuis),
+            ("horodatage", "<", jusqu_a),
+        ):
+            if valeur is not None:
+                conditions.append(f"{colonne} {operateur} ?")
+                parametres.append(valeur)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        requete = (f"SELECT horodatage, utilisateur, table_nom, ligne_id, action, avant, apres "
+                   f"FROM audit {where} ORDER BY horodatage DESC, id DESC LIMIT ? OFFSET ?")
+        with self.verrou:
+            return pd.read_sql_query(requete, self.connexion, params=parametres + [limite, decalage])
+
+    def utilisateurs(self):
+        with self.verrou:
+            return [u for (u,) in self.connexion.execute(
+                "SELECT DISTINCT utilisateur FROM audit WHERE utilisateur IS NOT NULL ORDER BY utilisateur")]
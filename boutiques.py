@@ -0,0 +1,46 @@
+import json
+import os
+import threading
+
+from stockage import ecrire_atomique, ecrire_json
+
+# ==============================
+# BOUTIQUES (PARTITIONS DE DONNÉES)
+# ==============================
+# Chaque boutique (ou stand) a son propre dossier de données : fichiers
+# Excel, journal, audit. Ses magasin, caches et agrégats sont indépendants
+# de ceux des autres ; la vue consolidée est construite à partir des
+# agrégats de chaque boutique, jamais des données brutes.
+
+FICHIER_BOUTIQUES = "boutiques.json"
+DOSSIER_DONNEES = "donnees"
+# La boutique historique garde ses fichiers à la racine
+PAR_DEFAUT = {"principale": {"nom": "Boutique principale", "dossier": "."}}
+
+
+class Boutiques:
+    def __init__(self, chemin=FICHIER_BOUTIQUES):
+        self.chemin = chemin
+        self.verrou = threading.Lock()
+        self.boutiques = dict(PAR_DEFAUT)
+        if os.path.exists(chemin):
+            with open(chemin, encoding="utf-8") as f:
+                self.boutiques = json.load(f)
+
+    def codes(self):
+        return list(self.boutiques)
+
+    def nom(self, code):
+        return self.boutiques[code]["nom"]
+
+    def dossier(self, code):
+        return self.boutiques[code]["dossier"]
+
+    def ajouter(self, code, nom):
+        with self.verrou:
+            if code in self.boutiques:
+                raise ValueError(f"La boutique « {code} » existe déjà")
+            dossier = os.path.join(DOSSIER_DONNEES, code)
+            os.makedirs(dossier, exist_ok=True)
+            self.boutiques[code] = {"nom": nom, "dossier": dossier}
+            ecrire_atomique(self.chemin, lambda chemin: ecrire_json(chemin, self.boutiques))
@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+# ==============================
+# SAISIE DES VENTES HORS LIGNE (sur la machine du stand)
+# ==============================
+# Les tickets sont enregistrés dans une base SQLite locale, chacun avec un
+# UUID tiré à la saisie, puis exportés par lots vers le dossier de réception
+# de la boutique (partage réseau, clé USB...) dès qu'il est joignable, ou
+# envoyés depuis la page Caisse. Renvoyer un lot est sans danger : l'import
+# ignore les UUID déjà enregistrés. N'utilise que la bibliothèque standard.
+#
+#     python capture.py vente 3:2 5:1:12 --canal Marché
+#     python capture.py attente
+#     python capture.py exporter Z:/caftans/donnees/souk/reception
+
+FICHIER_CAPTURE = "capture.db"
+CANAUX = ("Boutique", "En ligne", "Marché")  # ceux de stockage.CANAUX, sans importer pandas
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    uuid TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    canal TEXT NOT NULL,
+    client TEXT,
+    lignes TEXT NOT NULL,
+    exporte TEXT
+);
+CREATE INDEX IF NOT EXISTS tickets_exporte ON tickets (exporte);
+"""
+
+
+def ouvrir(chemin):
+    connexion = sqlite3.connect(chemin)
+    connexion.executescript(SCHEMA)
+    return connexion
+
+
+def lire_lignes(articles):
+    """« 3:2 » -> (3, 2) : ID produit, quantité (1 par défaut) ; « 3:2:12 » ajoute l'ID de la variante."""
+    lignes = []
+    for article in articles:
+        produit, _, reste = article.partition(":")
+        quantite, _, variante = reste.partition(":")
+        lignes.append([int(produit), int(quantite or 1)] + ([int(variante)] if variante else []))
+        if lignes[-1][1] < 1:
+            raise ValueError(f"quantité invalide : {article}")
+    return lignes
+
+
+def enregistrer(connexion, lignes, canal, client=""):
+    identifiant = str(uuid.uuid4())
+    with connexion:
+        connexion.execute("INSERT INTO tickets (uuid, date, canal, client, lignes) VALUES (?, ?, ?, ?, ?)",
+                          (identifiant, datetime.now().strftime("%Y-%m-%d"), canal, client, json.dumps(lignes)))
+    return identifiant
+
+
+def en_attente(connexion, tout=False):
+    requete = "SELECT uuid, date, canal, client, lignes FROM tickets"
+    if not tout:
+        requete += " WHERE exporte IS NULL"
+    return [{"uuid": u, "date": d, "canal": c, "client": cl or "", "lignes": json.loads(l)}
+            for u, d, c, cl, l in connexion.execute(requete + " ORDER BY rowid")]
+
+
+def exporter(connexion, dossier, tout=False):
+    """Écrit les tickets en attente dans un fichier du dossier de réception,
+    de façon atomique, puis les marque exportés. Renvoie (fichier, nombre)."""
+    tickets = en_attente(connexion, tout)
+    if not tickets:
+        return None, 0
+    nom = f"lot_{datetime.now():%Y%m%d_%H%M%S}_{socket.gethostname()}_{uuid.uuid4().hex[:8]}.jsonl"
+    descripteur, temporaire = tempfile.mkstemp(dir=dossier, prefix=".tmp-", suffix=".part")
+    with os.fdopen(descripteur, "w", encoding="utf-8") as f:
+        for ticket in tickets:
+            f.write(json.dumps(ticket, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    chemin = os.path.join(dossier, nom)
+    os.replace(temporaire, chemin)
+    with connexion:
+        connexion.executemany("UPDATE tickets SET exporte = ? WHERE uuid = ?",
+                              [(nom, t["uuid"]) for t in tickets])
+    return chemin, len(tickets)
+
+
+def main(arguments=None):
+    parseur = argparse.ArgumentParser(description="Saisie des ventes hors ligne")
+    parseur.add_argument("--base", default=FICHIER_CAPTURE, help="base SQLite locale")
+    commandes = parseur.add_subparsers(dest="commande", required=True)
+    vente = commandes.add_parser("vente", help="enregistrer un ticket")
+    vente.add_argument("articles", nargs="+", help="ID_PRODUIT[:QUANTITÉ[:ID_VARIANTE]]")
+    vente.add_argument("--canal", default="Marché", choices=CANAUX)
+    vente.add_argument("--client", default="")
+    attente = commandes.add_parser("attente", help="lister les tickets non exportés")
+    attente.add_argument("--tout", action="store_true", help="y compris ceux déjà exportés")
+    export = commandes.add_parser("exporter", help="déposer les tickets en attente dans le dossier de réception")
+    export.add_argument("dossier")
+    export.add_argument("--tout", action="store_true", help="renvoyer aussi les tickets déjà exportés")
+    args = parseur.parse_args(arguments)
+
+    connexion = ouvrir(args.base)
+    if args.commande == "vente":
+        try:
+            lignes = lire_lignes(args.articles)
+        except ValueError as exc:
+            parseur.error(f"article invalide ({exc})")
+        print(enregistrer(connexion, lignes, args.canal, args.client))
+    elif args.commande == "attente":
+        for ticket in en_attente(connexion, args.tout):
+            print(json.dumps(ticket, ensure_ascii=False))
+    else:
+        if not os.path.isdir(args.dossier):
+            print(f"Dossier de réception injoignable : {args.dossier} ; les tickets restent en attente.",
+                  file=sys.stderr)
+            return 1
+        chemin, nombre = exporter(connexion, args.dossier, args.tout)
+        print(f"{nombre} ticket(s) exporté(s)" + (f" dans {chemin}" if chemin else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
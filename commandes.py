@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from variantes import operations_stock
+
+# ==============================
+# COMMANDES
+# ==============================
+# Une commande = un en-tête (table « commandes ») + ses lignes (table
+# « ventes ») + les sorties de stock, écrits ensemble en un seul lot du
+# magasin. Utilisé par le panier, la caisse et l'import des ventes saisies
+# hors ligne.
+
+
+def operations_commandes(m, commandes):
+    """Opérations d'écriture d'une ou plusieurs commandes, et leurs IDs.
+
+    `commandes` : [{"lignes": [(ID produit, quantité[, ID variante])], "canal", "client",
+    "date" (aujourd'hui par défaut), "capture" (ID attribué hors ligne)}].
+    À appeler sous le verrou du magasin, jusqu'à l'écriture du lot.
+    """
+    premier = m.prochain_id("commandes")
+    operations, ids, sorties = [], [], {}
+    for k, commande in enumerate(commandes):
+        commande_id = premier + k
+        date = commande.get("date") or datetime.now().strftime("%Y-%m-%d")
+        operations.append({"op": "ajouter", "table": "commandes", "valeurs": {
+            "ID": commande_id, "Date": date, "Canal": commande["canal"], "Client": commande.get("client", ""),
+            "Capture_ID": commande.get("capture"),
+        }})
+        for produit_id, quantite, *variante in commande["lignes"]:
+            variante_id = variante[0] if variante else 0
+            operations.append({"op": "ajouter", "table": "ventes", "valeurs": {
+                "Date": date, "Produit_ID": produit_id, "Quantité": quantite,
+                "Canal": commande["canal"], "Commande_ID": commande_id, "Variante_ID": variante_id,
+            }})
+            cle = (produit_id, variante_id)
+            sorties[cle] = sorties.get(cle, 0) - quantite
+        ids.append(commande_id)
+    # Un seul mouvement de stock par produit (et variante), même s'il figure sur plusieurs lignes
+    operations += operations_stock(m, sorties)
+    return operations, ids
+
+
+def valider_commande(m, canal, client, lignes, par=None):
+    """Enregistre une commande en un seul lot. `lignes` : [(ID produit, quantité[, ID variante])].
+    Renvoie l'ID de la commande."""
+    with m.verrou:
+        operations, ids = operations_commandes(m, [{"lignes": lignes, "canal": canal, "client": client}])
+        m.ecrire_lot(operations, par=par)
+        return ids[0]
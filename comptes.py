@@ -0,0 +1,127 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+from stockage import ecrire_atomique, ecrire_json
+
+# ==============================
+# COMPTES UTILISATEURS
+# ==============================
+# Les mots de passe ne sont jamais stockés : seulement un sel aléatoire et
+# une empreinte scrypt (volontairement lente), avec ses paramètres pour
+# pouvoir les durcir plus tard sans invalider les comptes existants.
+
+FICHIER_COMPTES = "utilisateurs.json"
+ROLES = ("admin", "vendeur", "comptable")
+PARAMETRES_SCRYPT = {"n": 2 ** 14, "r": 8, "p": 1}
+
+
+def empreinte(mot_de_passe, sel, n, r, p):
+    return hashlib.scrypt(mot_de_passe.encode("utf-8"), salt=bytes.fromhex(sel), n=n, r=r, p=p,
+                          maxmem=256 * 1024 * 1024, dklen=32).hex()
+
+
+def nouvelle_entree(mot_de_passe):
+    sel = secrets.token_hex(16)
+    return {"sel": sel, **PARAMETRES_SCRYPT, "empreinte": empreinte(mot_de_passe, sel, **PARAMETRES_SCRYPT)}
+
+
+class Comptes:
+    def __init__(self, chemin=FICHIER_COMPTES):
+        self.chemin = chemin
+        self.verrou = threading.Lock()
+        self.comptes = {}
+        if os.path.exists(chemin):
+            with open(chemin, encoding="utf-8") as f:
+                self.comptes = json.load(f)
+        # Empreinte factice : un nom inconnu coûte le même temps qu'un mauvais mot de passe
+        self.factice = nouvelle_entree(secrets.token_hex(8))
+
+    def _enregistrer(self):
+        ecrire_atomique(self.chemin, lambda chemin: ecrire_json(chemin, self.comptes))
+
+    @property
+    def vide(self):
+        return not self.comptes
+
+    def noms(self):
+        return sorted(self.comptes)
+
+    def verifier(self, nom, mot_de_passe):
+        entree = self.comptes.get(nom, self.factice)
+        calcule = empreinte(mot_de_passe, entree["sel"], entree["n"], entree["r"], entree["p"])
+        return hmac.compare_digest(calcule, entree["empreinte"]) and nom in self.comptes
+
+    def role(self, nom):
+        """Rôle du compte, ou None s'il n'existe pas (ou plus)."""
+        if nom not in self.comptes:
+            return None
+        # Les comptes créés avant les rôles avaient accès à tout
+        return self.comptes[nom].get("role", "admin")
+
+    def boutiques(self, nom):
+        """Codes des boutiques accessibles, ou None pour toutes."""
+        return self.comptes.get(nom, {}).get("boutiques")
+
+    def definir(self, nom, mot_de_passe=None, role=None, boutiques=...):
+        """Crée le compte ou change son mot de passe, son rôle et / ou ses boutiques
+        (`boutiques=None` : toutes)."""
+        with self.verrou:
+            entree = dict(self.comptes.get(nom, {}))
+            if mot_de_passe is not None:
+                entree.update(nouvelle_entree(mot_de_passe))
+            if role is not None:
+                entree["role"] = role
+            if boutiques is not ...:
+                entree["boutiques"] = boutiques
+            self.comptes[nom] = entree
+            self._enregistrer()
+
+    def supprimer(self, nom):
+        with self.verrou:
+            self.comptes.pop(nom, None)
+            self._enregistrer()
+
+
+# ==============================
+# LIMITATION DES TENTATIVES DE CONNEXION
+# ==============================
+# Seau à jetons en mémoire : chaque clé (utilisateur ou adresse IP) dispose
+# de `capacite` tentatives, rechargées au rythme de `recharge` par seconde.
+
+class Limiteur:
+    def __init__(self, capacite=5, recharge=1 / 60):
+        self.capacite = capacite
+        self.recharge = recharge
+        self.seaux = {}  # clé -> (jetons, dernier passage)
+        self.verrou = threading.Lock()
+
+    def _jetons(self, cle, maintenant):
+        jetons, dernier = self.seaux.get(cle, (self.capacite, maintenant))
+        return min(self.capacite, jetons + (maintenant - dernier) * self.recharge)
+
+    def autoriser(self, *cles):
+        """Consomme un jeton pour chaque clé si toutes en ont encore un."""
+        maintenant = time.monotonic()
+        with self.verrou:
+            jetons = {cle: self._jetons(cle, maintenant) for cle in cles}
+            if any(j < 1 for j in jetons.values()):
+                return False
+            for cle, j in jetons.items():
+                self.seaux[cle] = (j - 1, maintenant)
+            return True
+
+    def attente(self, *cles):
+        """Secondes avant la prochaine tentative autorisée."""
+        maintenant = time.monotonic()
+        with self.verrou:
+            manque = max(1 - self._jetons(cle, maintenant) for cle in cles)
+        return max(0.0, manque / self.recharge)
+
+    def reinitialiser(self, cle):
+        with self.verrou:
+            self.seaux.pop(cle, None)
@@ -0,0 +1,381 @@
+import threading
+from datetime import datetime
+from functools import lru_cache
+from itertools import product as produit_cartesien
+
+import numpy as np
+import pandas as pd
+
+# ==============================
+# CUBES OLAP
+# ==============================
+# Un cube garde, pour chaque combinaison de niveaux de ses dimensions
+# (un « cuboïde »), les mesures déjà agrégées. Tous les cuboïdes sont
+# mis à jour par delta à chaque écriture : un roll-up ou un drill-down
+# n'est qu'une lecture dans un dictionnaire, jamais un groupby sur les faits.
+
+INCONNU = "Inconnu"
+
+
+class Dimension:
+    """Dimension à un seul niveau : la clé est la valeur elle-même."""
+
+    def __init__(self, nom, niveaux=None):
+        self.nom = nom
+        self.niveaux = niveaux or [nom]  # du plus fin au plus agrégé
+
+    def cles(self, valeur):
+        return {self.niveaux[0]: INCONNU if pd.isna(valeur) else valeur}
+
+    def cles_serie(self, serie, niveau):
+        return serie.fillna(INCONNU)
+
+    def vers(self, cle, niveau_source, niveau_cible):
+        return cle
+
+
+class DimensionDate(Dimension):
+    """Hiérarchie Jour → Semaine (ISO) → Mois → Année."""
+
+    def __init__(self, nom="Date"):
+        super().__init__(nom, ["Jour", "Semaine", "Mois", "Année"])
+
+    def cles(self, valeur):
+        date = pd.to_datetime(valeur, errors="coerce")
+        if pd.isna(date):
+            return dict.fromkeys(self.niveaux, INCONNU)
+        annee_iso, semaine, _ = date.isocalendar()
+        return {
+            "Jour": date.strftime("%Y-%m-%d"),
+            "Semaine": f"{annee_iso}-S{semaine:02d}",
+            "Mois": date.strftime("%Y-%m"),
+            "Année": date.strftime("%Y"),
+        }
+
+    def cles_serie(self, serie, niveau):
+        dates = pd.to_datetime(serie, errors="coerce")
+        if niveau == "Semaine":
+            iso = dates.dt.isocalendar()
+            cles = iso["year"].astype(str) + "-S" + iso["week"].astype(str).str.zfill(2)
+            return cles.where(dates.notna(), INCONNU)
+        formats = {"Jour": "%Y-%m-%d", "Mois": "%Y-%m", "Année": "%Y"}
+        return dates.dt.strftime(formats[niveau]).fillna(INCONNU)
+
+    @lru_cache(maxsize=4096)
+    def vers(self, cle, niveau_source, niveau_cible):
+        if cle == INCONNU or niveau_source == niveau_cible:
+            return cle
+        if niveau_source == "Semaine":
+            date = datetime.strptime(cle + "-1", "%G-S%V-%u")
+        else:
+            date = datetime.strptime(cle, {"Jour": "%Y-%m-%d", "Mois": "%Y-%m", "Année": "%Y"}[niveau_source])
+        return self.cles(date)[niveau_cible]
+
+
+class Cube:
+    def __init__(self, dimensions, mesures, index_sur=()):
+        self.dimensions = dimensions
+        self.mesures = mesures
+        self.noms = [d.nom for d in dimensions]
+        # Un cuboïde par combinaison de niveaux (None = dimension agrégée)
+        self.cuboides = {
+            niveaux: {} for niveaux in produit_cartesien(*[d.niveaux + [None] for d in dimensions])
+        }
+        self.base = tuple(d.niveaux[0] for d in dimensions)
+        # Index valeur -> clés du cuboïde de base, pour réévaluer ou retirer
+        # un membre (un produit) sans parcourir tout le cube
+        self.index = {nom: {} for nom in index_sur}
+        self.verrou = threading.RLock()
+
+    @classmethod
+    def construire(cls, faits, dimensions, mesures, index_sur=()):
+        """Construit tous les cuboïdes à partir d'un DataFrame de faits
+        (une colonne par dimension, une par mesure) : un groupby par cuboïde."""
+        cube = cls(dimensions, mesures, index_sur)
+        if faits.empty:
+            return cube
+        base = pd.DataFrame({d.nom: d.cles_serie(faits[d.nom], d.niveaux[0]) for d in dimensions})
+        base[mesures] = faits[mesures].to_numpy()
+        base = base.groupby(cube.noms, as_index=False, dropna=False)[mesures].sum()
+
+        for niveaux, cellules in cube.cuboides.items():
+            colonnes = []
+            for dim, niveau in zip(dimensions, niveaux):
+                if niveau is None:
+                    continue
+                fines = base[dim.nom]
+                if niveau != dim.niveaux[0]:
+                    correspondance = {c: dim.vers(c, dim.niveaux[0], niveau) for c in fines.unique()}
+                    fines = fines.map(correspondance)
+                colonnes.append(fines.rename(dim.nom))
+            if colonnes:
+                agrege = base[mesures].groupby(colonnes).sum()
+                cles = agrege.index if len(colonnes) > 1 else [(c,) for c in agrege.index]
+                cellules.update(zip(cles, agrege.to_numpy().tolist()))
+            else:
+                cellules[()] = base[mesures].sum().tolist()
+
+        for nom in cube.index:
+            position = cube.noms.index(nom)
+            for cle in cube.cuboides[cube.base]:
+                cube.index[nom].setdefault(cle[position], set()).add(cle)
+        return cube
+
+    def ajouter(self, coordonnees, valeurs, signe=1):
+        """Ajoute (signe=1) ou retire (signe=-1) un fait dans tous les cuboïdes.
+
+        `coordonnees` : valeur brute par dimension ; `valeurs` : une par mesure.
+        """
+        cles = [d.cles(coordonnees[d.nom]) for d in self.dimensions]
+        with self.verrou:
+            self._propager([c[d.niveaux[0]] for c, d in zip(cles, self.dimensions)], cles,
+                           [signe * v for v in valeurs])
+
+    def _propager(self, cle_base, cles, deltas):
+        for niveaux, cellules in self.cuboides.items():
+            cle = tuple(c[n] for c, n in zip(cles, niveaux) if n is not None)
+            cellule = cellules.get(cle)
+            if cellule is None:
+                cellule = cellules[cle] = [0] * len(deltas)
+            for i, delta in enumerate(deltas):
+                cellule[i] += delta
+            if niveaux == self.base and not any(cellule):
+                del cellules[cle]
+        cle_base = tuple(cle_base)
+        for nom, index in self.index.items():
+            valeur = cle_base[self.noms.index(nom)]
+            if cle_base in self.cuboides[self.base]:
+                index.setdefault(valeur, set()).add(cle_base)
+            else:
+                index.get(valeur, set()).discard(cle_base)
+
+    def _cles_depuis_base(self, cle_base):
+        return [{n: d.vers(c, d.niveaux[0], n) for n in d.niveaux} for c, d in zip(cle_base, self.dimensions)]
+
+    def reevaluer(self, nom, valeur, facteurs, base):
+        """Corrige les mesures d'un membre proportionnellement à la mesure `base`.
+
+        Exemple : un changement de prix d'un produit ajoute `Δprix × Quantité`
+        au Revenu de chacune de ses cellules, et de leurs agrégats.
+        """
+        i_base = self.mesures.index(base)
+        with self.verrou:
+            for cle in list(self.index[nom].get(valeur, ())):
+                cellule = self.cuboides[self.base][cle]
+                deltas = [cellule[i_base] * facteurs.get(m, 0) for m in self.mesures]
+                self._propager(cle, self._cles_depuis_base(cle), deltas)
+
+    def retirer(self, nom, valeur):
+        """Retire toutes les contributions d'un membre (ex. un produit supprimé)."""
+        with self.verrou:
+            for cle in list(self.index[nom].get(valeur, ())):
+                cellule = self.cuboides[self.base][cle]
+                self._propager(cle, self._cles_depuis_base(cle), [-v for v in cellule])
+            self.index[nom].pop(valeur, None)
+
+    @classmethod
+    def consolider(cls, sources, renommages=None, dimension="Boutique"):
+        """Cube de consolidation à partir des cuboïdes de cubes de même forme.
+
+        `sources` : {code: cube} ; une dimension `dimension` est ajoutée.
+        `renommages` : {code: {dimension: {clé: nouvelle clé}}}, par ex. pour
+        regrouper les produits de plusieurs boutiques par nom plutôt que par ID.
+        Parcourt les cellules agrégées des sources, jamais leurs faits.
+        """
+        premier = next(iter(sources.values()))
+        cube = cls(premier.dimensions + [Dimension(dimension)], premier.mesures)
+        for code, source in sources.items():
+            renommer = (renommages or {}).get(code, {})
+            with source.verrou:
+                for niveaux, cellules in source.cuboides.items():
+                    presentes = [d.nom for d, n in zip(source.dimensions, niveaux) if n is not None]
+                    tables = [renommer.get(nom) for nom in presentes]
+                    for cle, valeurs in cellules.items():
+                        if any(tables):
+                            cle = tuple(t.get(c, c) if t else c for t, c in zip(tables, cle))
+                        for cible, cle_cible in ((niveaux + (dimension,), cle + (code,)), (niveaux + (None,), cle)):
+                            cellule = cube.cuboides[cible].setdefault(cle_cible, [0] * len(valeurs))
+                            for i, v in enumerate(valeurs):
+                                cellule[i] += v
+        return cube
+
+    def requete(self, niveaux, filtres=None):
+        """Lit un cuboïde précalculé.
+
+        `niveaux` : {dimension: niveau} à conserver (les autres sont agrégées) ;
+        `filtres` : {dimension: (niveau, clé)} pour le drill-down, par ex.
+        {"Date": ("Année", "2025")} avec niveaux {"Date": "Mois"}.
+        """
+        filtres = filtres or {}
+        choix = tuple(niveaux.get(d.nom) or (filtres[d.nom][0] if d.nom in filtres else None)
+                      for d in self.dimensions)
+        gardes = [d.nom for d in self.dimensions if d.nom in niveaux]
+        presents = [d for d, n in zip(self.dimensions, choix) if n is not None]
+        with self.verrou:
+            lignes = [(*cle, *cellule) for cle, cellule in self.cuboides[choix].items()]
+        df = pd.DataFrame(lignes, columns=[d.nom for d in presents] + self.mesures)
+        for d in presents:
+            if d.nom in filtres:
+                niveau, valeur = filtres[d.nom]
+                source = choix[self.noms.index(d.nom)]
+                df = df[df[d.nom].map(lambda c: d.vers(c, source, niveau)) == valeur]
+        if len(gardes) < len(presents):
+            df = df.groupby(gardes, as_index=False)[self.mesures].sum() if gardes else \
+                df[self.mesures].sum().to_frame().T
+        df = df[(df[self.mesures] != 0).any(axis=1)]
+        return df.sort_values(gardes).reset_index(drop=True) if gardes else df.reset_index(drop=True)
+
+
+# ==============================
+# ENTREPÔT DES RAPPORTS
+# ==============================
+# Deux cubes de faits : les ventes (date × produit × canal × variante) et les charges
+# (date × catégorie × type). Ils partagent la dimension date, ce qui permet de
+# calculer le profit à n'importe quel niveau de temps.
+
+MESURES_VENTES = ["Quantité", "Revenu", "Coût"]
+MESURES_CHARGES = ["Charges"]
+
+
+def cout_unitaire(produit):
+    return produit["Tissu"] + produit["Main-d'œuvre"] + produit["Accessoires"]
+
+
+def rentabilite(produits, entrepot):
+    """Table des produits complétée de ses indicateurs de rentabilité.
+
+    Tout est calculé colonne par colonne sur la table, avec les cumuls de
+    ventes par produit lus dans le cube (aucun parcours des ventes). Le point
+    mort est le nombre d'unités d'un produit qui couvrirait à lui seul les
+    charges fixes.
+    """
+    cumuls = entrepot.ventes.requete({"Produit": "Produit"}).set_index("Produit").reindex(produits["ID"])
+    charges = entrepot.charges.requete({"Type": "Type"}, {"Type": ("Type", "Fixe")})["Charges"].sum()
+    cout = cout_unitaire(produits).to_numpy(dtype=float)
+    prix = produits["Prix vente"].to_numpy(dtype=float)
+    marge = prix - cout
+    with np.errstate(divide="ignore", invalid="ignore"):
+        taux = np.where(prix > 0, marge / prix * 100, np.nan)
+        point_mort = np.where(marge > 0, np.ceil(charges / marge), np.nan)
+    return produits.assign(**{
+        "Coût unitaire": cout,
+        "Marge unitaire": marge,
+        "Marge %": taux.round(1),
+        "Unités vendues": cumuls["Quantité"].fillna(0).to_numpy(),
+        "Marge cumulée": (cumuls["Revenu"] - cumuls["Coût"]).fillna(0).to_numpy(),
+        "Point mort (unités)": point_mort,
+    })
+
+
+class Entrepot:
+    def __init__(self, ventes, charges):
+        self.ventes = ventes
+        self.charges = charges
+        self.version = 0  # incrémentée à chaque écriture suivie
+
+    @staticmethod
+    def dimensions_ventes():
+        # Chaque vente porte son produit : le cuboïde sans variante est le cumul
+        # par produit, maintenu comme les autres, sans jointure à la lecture
+        return [DimensionDate(), Dimension("Produit"), Dimension("Canal"), Dimension("Variante")]
+
+    @staticmethod
+    def dimensions_charges():
+        return [DimensionDate(), Dimension("Catégorie"), Dimension("Type")]
+
+    @classmethod
+    def construire(cls, ventes, produits, charges, avancer=None):
+        """`avancer(fraction, message)` : rappel optionnel de progression."""
+        avancer = avancer or (lambda *_: None)
+        avancer(0.1, "Cube des ventes")
+        if ventes.empty or produits.empty:
+            faits = pd.DataFrame(columns=["Date", "Produit", "Canal", "Variante"] + MESURES_VENTES)
+        else:
+            faits = ventes.merge(produits, left_on="Produit_ID", right_on="ID", suffixes=("_vente", "_prod"))
+            faits = pd.DataFrame({
+                "Date": faits["Date"],
+                "Produit": faits["Produit_ID"],
+                "Canal": faits["Canal"],
+                "Variante": faits["Variante_ID"].fillna(0).astype(int),
+                "Quantité": faits["Quantité"],
+                "Revenu": faits["Quantité"] * faits["Prix vente"],
+                "Coût": faits["Quantité"] * cout_unitaire(faits),
+            })
+        cube_ventes = Cube.construire(faits, cls.dimensions_ventes(), MESURES_VENTES, index_sur=("Produit",))
+        avancer(0.7, "Cube des charges")
+
+        faits_charges = charges.rename(columns={"Montant": "Charges"})[["Date", "Catégorie", "Type", "Charges"]]
+        cube_charges = Cube.construire(faits_charges, cls.dimensions_charges(), MESURES_CHARGES)
+        return cls(cube_ventes, cube_charges)
+
+    def enregistrer_vente(self, vente, produit, signe=1):
+        """`vente` : Date, Quantité, Canal, Variante_ID ; `produit` : la ligne du produit vendu."""
+        qte = vente["Quantité"]
+        variante = vente.get("Variante_ID", 0)
+        self.ventes.ajouter(
+            {"Date": vente["Date"], "Produit": produit["ID"], "Canal": vente["Canal"],
+             "Variante": 0 if pd.isna(variante) else int(variante)},
+            [qte, qte * produit["Prix vente"], qte * cout_unitaire(produit)],
+            signe,
+        )
+
+    def enregistrer_charge(self, charge, signe=1):
+        self.charges.ajouter({"Date": charge["Date"], "Catégorie": charge["Catégorie"], "Type": charge["Type"]},
+                             [charge["Montant"]], signe)
+
+    def reevaluer_produit(self, ancien, nouveau):
+        """Répercute un changement de prix ou de coûts sur les seules cellules du produit."""
+        facteurs = {
+            "Revenu": nouveau["Prix vente"] - ancien["Prix vente"],
+            "Coût": cout_unitaire(nouveau) - cout_unitaire(ancien),
+        }
+        if any(facteurs.values()):  # un simple mouvement de stock ne touche pas aux cubes
+            self.ventes.reevaluer("Produit", ancien["ID"], facteurs, base="Quantité")
+
+    def retirer_produit(self, produit_id):
+        self.ventes.retirer("Produit", produit_id)
+
+    def suivre(self, table, avant, apres, produits):
+        """Abonné du magasin : répercute une écriture (ligne avant / après)
+        sur les cubes. `produits` est la table des produits à jour."""
+        self.version += 1
+        def produit(identifiant):
+            trouve = produits.loc[produits["ID"] == identifiant]
+            return None if trouve.empty else trouve.iloc[0]
+
+        if table == "ventes":
+            for vente, signe in ((avant, -1), (apres, 1)):
+                # une vente orpheline (produit supprimé) n'est pas comptée
+                if vente is not None and (p := produit(vente["Produit_ID"])) is not None:
+                    self.enregistrer_vente(vente, p, signe)
+        elif table == "charges":
+            for charge, signe in ((avant, -1), (apres, 1)):
+                if charge is not None:
+                    self.enregistrer_charge(charge, signe)
+        elif table == "produits" and avant is not None:
+            if apres is None:
+                self.retirer_produit(avant["ID"])
+            else:
+                self.reevaluer_produit(avant, apres)
+
+    @classmethod
+    def consolider(cls, entrepots, noms_produits, noms_variantes=None):
+        """Vue multi-boutiques : `entrepots`, `noms_produits` et `noms_variantes`
+        sont indexés par code de boutique ; produits et variantes sont regroupés par nom."""
+        noms_variantes = noms_variantes or {}
+        return cls(
+            Cube.consolider({code: e.ventes for code, e in entrepots.items()},
+                            {code: {"Produit": noms, "Variante": noms_variantes.get(code, {})}
+                             for code, noms in noms_produits.items()}),
+            Cube.consolider({code: e.charges for code, e in entrepots.items()}),
+        )
+
+    def synthese(self, niveau_date, filtre_date=None):
+        """Revenu, coûts, charges et profit par période au niveau demandé."""
+        filtres = {"Date": filtre_date} if filtre_date else None
+        ventes = self.ventes.requete({"Date": niveau_date}, filtres)
+        charges = self.charges.requete({"Date": niveau_date}, filtres)
+        df = ventes.merge(charges, on="Date", how="outer").fillna(0)
+        df["Marge"] = df["Revenu"] - df["Coût"]
+        df["Profit"] = df["Marge"] - df["Charges"]
+        return df.sort_values("Date").reset_index(drop=True)
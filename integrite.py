@@ -0,0 +1,152 @@
+import threading
+
+import pandas as pd
+
+from stockage import CANAUX, TYPES_CHARGE, TYPES_MATIERE
+
+# ==============================
+# CONTRÔLES D'INTÉGRITÉ
+# ==============================
+# Chaque contrôle est une expression vectorisée sur une table qui désigne
+# les lignes fautives. Le résultat est une liste d'anomalies (table, ID,
+# contrôle, détail), vide si tout va bien.
+#
+# Les mêmes contrôles servent à la vérification complète (toutes les
+# lignes) et au suivi incrémental (la seule ligne écrite) : seule change la
+# façon de savoir si une référence (produit, commande) existe.
+
+COLONNES = ["Table", "ID", "Contrôle", "Détail"]
+ORPHELINE = "Produit inconnu"
+
+
+def anomalies(table, df, masque, controle, detail):
+    fautives = df[masque]
+    return pd.DataFrame({"Table": table, "ID": fautives["ID"].to_numpy(), "Contrôle": controle,
+                         "Détail": detail(fautives).to_numpy() if len(fautives) else []})
+
+
+def numerique_invalide(serie, strict=False):
+    valeurs = pd.to_numeric(serie, errors="coerce")
+    return valeurs.isna() | ((valeurs <= 0) if strict else (valeurs < 0))
+
+
+def controles_table(nom, df, existe):
+    """Contrôles ligne à ligne d'une table ; `existe(table, ids)` -> masque des IDs présents."""
+    resultats = []
+    if nom == "produits":
+        for col in ("Prix vente", "Tissu", "Main-d'œuvre", "Accessoires"):
+            resultats.append(anomalies(nom, df, numerique_invalide(df[col]), f"{col} invalide",
+                                       lambda f, col=col: f[col].astype(str)))
+        resultats.append(anomalies(nom, df, pd.to_numeric(df["Stock"], errors="coerce") < 0, "Stock négatif",
+                                   lambda f: f["Stock"].astype(str)))
+    if nom == "ventes":
+        resultats.append(anomalies(nom, df, ~existe("produits", df["Produit_ID"]), ORPHELINE,
+                                   lambda f: "Produit_ID " + f["Produit_ID"].astype(str)))
+        resultats.append(anomalies(nom, df, numerique_invalide(df["Quantité"], strict=True), "Quantité invalide",
+                                   lambda f: f["Quantité"].astype(str)))
+        if "Variante_ID" in df:
+            variantes = pd.to_numeric(df["Variante_ID"], errors="coerce").fillna(0)
+            resultats.append(anomalies(nom, df, (variantes != 0) & ~existe("variantes", variantes),
+                                       "Variante inconnue", lambda f: "Variante_ID " + f["Variante_ID"].astype(str)))
+        if "Commande_ID" in df:
+            commandes = pd.to_numeric(df["Commande_ID"], errors="coerce").fillna(0)
+            resultats.append(anomalies(nom, df, (commandes != 0) & ~existe("commandes", commandes),
+                                       "Commande inconnue", lambda f: "Commande_ID " + f["Commande_ID"].astype(str)))
+    if nom == "variantes":
+        resultats.append(anomalies(nom, df, ~existe("produits", df["Produit_ID"]), ORPHELINE,
+                                   lambda f: "Produit_ID " + f["Produit_ID"].astype(str)))
+        resultats.append(anomalies(nom, df, pd.to_numeric(df["Stock"], errors="coerce") < 0, "Stock négatif",
+                                   lambda f: f["Stock"].astype(str)))
+    if nom == "matieres":
+        resultats.append(anomalies(nom, df, numerique_invalide(df["Prix unitaire"]), "Prix unitaire invalide",
+                                   lambda f: f["Prix unitaire"].astype(str)))
+        resultats.append(anomalies(nom, df, ~df["Type"].isin(TYPES_MATIERE), "Type inconnu",
+                                   lambda f: f["Type"].astype(str)))
+    if nom == "nomenclatures":
+        resultats.append(anomalies(nom, df, ~existe("produits", df["Produit_ID"]), ORPHELINE,
+                                   lambda f: "Produit_ID " + f["Produit_ID"].astype(str)))
+        resultats.append(anomalies(nom, df, ~existe("matieres", df["Matiere_ID"]), "Matière inconnue",
+                                   lambda f: "Matiere_ID " + f["Matiere_ID"].astype(str)))
+        resultats.append(anomalies(nom, df, numerique_invalide(df["Quantité"], strict=True), "Quantité invalide",
+                                   lambda f: f["Quantité"].astype(str)))
+    if nom in ("ventes", "commandes"):
+        resultats.append(anomalies(nom, df, ~df["Canal"].isin(CANAUX), "Canal inconnu",
+                                   lambda f: f["Canal"].astype(str)))
+    if nom == "charges":
+        resultats.append(anomalies(nom, df, numerique_invalide(df["Montant"]), "Montant invalide",
+                                   lambda f: f["Montant"].astype(str)))
+        resultats.append(anomalies(nom, df, ~df["Type"].isin(TYPES_CHARGE), "Type inconnu",
+                                   lambda f: f["Type"].astype(str)))
+    if nom in ("ventes", "charges", "commandes"):
+        resultats.append(anomalies(nom, df, pd.to_datetime(df["Date"], errors="coerce").isna(), "Date invalide",
+                                   lambda f: f["Date"].astype(str)))
+    return [r for r in resultats if not r.empty]
+
+
+def controler(frames):
+    """Contrôle complet des tables visibles `frames` ({nom: DataFrame})."""
+    def existe(table, ids):
+        return ids.isin(frames[table]["ID"]) if table in frames else pd.Series(True, index=ids.index)
+
+    resultats = []
+    for nom, df in frames.items():
+        resultats.append(anomalies(nom, df, df["ID"].duplicated(keep=False), "ID en double",
+                                   lambda f: "ID " + f["ID"].astype(str)))
+        resultats.extend(controles_table(nom, df, existe))
+    resultats = [r for r in resultats if not r.empty]
+    return pd.concat(resultats, ignore_index=True) if resultats else pd.DataFrame(columns=COLONNES)
+
+
+class Integrite:
+    """Anomalies d'un magasin : vérification complète à la création ou à la
+    demande, puis tenue à jour à chaque écriture par abonnement."""
+
+    def __init__(self, magasin):
+        self.magasin = magasin
+        self.anomalies = {}  # (table, ID, contrôle) -> détail
+        self.derniere_verification = None
+        self.verrou = threading.Lock()
+        with magasin.verrou:  # aucune écriture entre la vérification et l'abonnement
+            self.verifier_tout()
+            magasin.compter("ventes", "Produit_ID", None)  # construit le compteur des ventes par produit
+            magasin.abonner(self.suivre)
+
+    def verifier_tout(self):
+        frames, _ = self.magasin.instantane()
+        resultats = controler(frames)
+        with self.verrou:
+            self.anomalies = {(t, i, c): d for t, i, c, d in resultats[COLONNES].itertuples(index=False)}
+            self.derniere_verification = pd.Timestamp.now().floor("s")
+        return len(resultats)
+
+    def _existe(self, table, ids):
+        return ids.map(lambda i: self.magasin.ligne(table, i) is not None).astype(bool)
+
+    def _remplacer(self, table, ids, nouvelles, controles=None):
+        """Remplace les anomalies des lignes `ids` (limitées à `controles` si donné)."""
+        ids = set(ids)
+        with self.verrou:
+            for cle in [c for c in self.anomalies if c[0] == table and c[1] in ids
+                        and (controles is None or c[2] in controles)]:
+                del self.anomalies[cle]
+            for r in nouvelles:
+                self.anomalies.update(((t, i, c), d) for t, i, c, d in r[COLONNES].itertuples(index=False))
+
+    def suivre(self, operation, avant, apres):
+        table, identifiant = operation["table"], operation["id"]
+        nouvelles = [] if apres is None else controles_table(table, apres.to_frame().T, self._existe)
+        self._remplacer(table, [identifiant], nouvelles)
+        # Un produit supprimé rend ses ventes orphelines ; restauré, il les rattache
+        if (table == "produits" and (avant is None) != (apres is None)
+                and self.magasin.compter("ventes", "Produit_ID", identifiant)):
+            ventes = self.magasin.df("ventes")
+            ventes = ventes[ventes["Produit_ID"] == identifiant]
+            orphelines = [] if apres is not None else [anomalies(
+                "ventes", ventes, pd.Series(True, index=ventes.index), ORPHELINE,
+                lambda f: "Produit_ID " + f["Produit_ID"].astype(str))]
+            self._remplacer("ventes", ventes["ID"].tolist(), orphelines, controles={ORPHELINE})
+
+    def resultats(self):
+        with self.verrou:
+            lignes = [(t, i, c, d) for (t, i, c), d in self.anomalies.items()]
+        return pd.DataFrame(lignes, columns=COLONNES).sort_values(["Table", "ID"]).reset_index(drop=True)
@@ -0,0 +1,124 @@
+import threading
+
+from stockage import TYPES_MATIERE
+
+# ==============================
+# MATIÈRES ET NOMENCLATURES
+# ==============================
+# Le catalogue des matières donne un prix au mètre (tissu) ou à la pièce
+# (accessoire) ; la nomenclature d'un produit liste les matières qu'il
+# consomme. Les coûts Tissu et Accessoires d'un produit qui a une
+# nomenclature en sont déduits et réécrits dans sa ligne, dans le même lot
+# que le changement qui les modifie : l'entrepôt ne réévalue alors que les
+# cellules de ces produits. L'index matière -> produits désigne les seuls
+# produits à recalculer quand un prix change.
+#
+# Un produit sans nomenclature garde ses coûts saisis à la main ; s'il perd
+# sa dernière ligne, il garde les derniers coûts calculés.
+
+UNITES = dict(zip(TYPES_MATIERE, ("m", "pièce")))
+COLONNE_COUT = dict(zip(TYPES_MATIERE, ("Tissu", "Accessoires")))
+
+
+class Nomenclatures:
+    """Index des nomenclatures d'un magasin, construit une fois puis suivi par abonnement."""
+
+    def __init__(self, magasin):
+        self.magasin = magasin
+        self.lignes = {}    # produit -> {ID ligne: (matière, quantité)}
+        self.produits = {}  # matière -> {produit: nombre de lignes}
+        self.verrou = threading.Lock()
+        with magasin.verrou:  # aucune écriture entre la lecture et l'abonnement
+            df = magasin.df("nomenclatures")
+            for ligne in zip(df["ID"].tolist(), df["Produit_ID"].tolist(), df["Matiere_ID"].tolist(),
+                             df["Quantité"].tolist()):
+                self._indexer(*ligne)
+            magasin.abonner(self.suivre)
+
+    def _indexer(self, identifiant, produit, matiere, quantite, signe=1):
+        identifiant, produit, matiere = int(identifiant), int(produit), int(matiere)
+        with self.verrou:
+            par_produit = self.produits.setdefault(matiere, {})
+            if signe > 0:
+                self.lignes.setdefault(produit, {})[identifiant] = (matiere, float(quantite))
+                par_produit[produit] = par_produit.get(produit, 0) + 1
+                return
+            self.lignes.get(produit, {}).pop(identifiant, None)
+            if not self.lignes.get(produit):
+                self.lignes.pop(produit, None)
+            par_produit[produit] = par_produit.get(produit, 1) - 1
+            if not par_produit[produit]:
+                del par_produit[produit]
+            if not par_produit:
+                del self.produits[matiere]
+
+    def suivre(self, operation, avant, apres):
+        if operation["table"] != "nomenclatures":
+            return
+        for ligne, signe in ((avant, -1), (apres, 1)):
+            if ligne is not None:
+                self._indexer(ligne["ID"], ligne["Produit_ID"], ligne["Matiere_ID"], ligne["Quantité"], signe)
+
+    def couts(self, lignes, prix=None):
+        """Coûts Tissu et Accessoires de `lignes` ({ID: (matière, quantité)}) ;
+        `prix` : {matière: (type, prix unitaire)} à la place du catalogue."""
+        couts = dict.fromkeys(COLONNE_COUT.values(), 0.0)
+        for matiere_id, quantite in lignes.values():
+            if prix and matiere_id in prix:
+                type_matiere, prix_unitaire = prix[matiere_id]
+            else:
+                matiere = self.magasin.ligne("matieres", matiere_id)
+                if matiere is None:
+                    continue
+                type_matiere, prix_unitaire = matiere["Type"], matiere["Prix unitaire"]
+            couts[COLONNE_COUT.get(type_matiere, "Accessoires")] += quantite * float(prix_unitaire)
+        return {colonne: round(cout, 2) for colonne, cout in couts.items()}
+
+    def operations_couts(self, produit_id, lignes=None, prix=None):
+        """Mise à jour des coûts d'un produit, si sa nomenclature les change."""
+        lignes = self.lignes.get(produit_id, {}) if lignes is None else lignes
+        produit = self.magasin.ligne("produits", produit_id)
+        if not lignes or produit is None:
+            return []
+        couts = self.couts(lignes, prix)
+        if all(float(produit[colonne]) == cout for colonne, cout in couts.items()):
+            return []
+        return [{"op": "modifier", "table": "produits", "id": produit_id, "valeurs": couts}]
+
+    def modifier_matiere(self, matiere_id, valeurs, par=None):
+        """Modifie une matière et recalcule, dans le même lot, les coûts des
+        seuls produits qui l'utilisent. Renvoie le nombre de produits recalculés."""
+        m = self.magasin
+        with m.verrou:
+            matiere = {**m.ligne("matieres", matiere_id).to_dict(), **valeurs}
+            prix = {matiere_id: (matiere["Type"], matiere["Prix unitaire"])}
+            operations = [{"op": "modifier", "table": "matieres", "id": matiere_id, "valeurs": valeurs}]
+            for produit_id in list(self.produits.get(matiere_id, ())):
+                operations += self.operations_couts(produit_id, prix=prix)
+            m.ecrire_lot(operations, par=par)
+            return len(operations) - 1
+
+    def supprimer_matiere(self, matiere_id, par=None):
+        """Supprime une matière qu'aucune nomenclature n'utilise.
+        Renvoie le nombre de produits qui l'utilisent (0 si supprimée)."""
+        with self.magasin.verrou:
+            nombre = len(self.produits.get(matiere_id, ()))
+            if not nombre:
+                self.magasin.supprimer("matieres", matiere_id, par=par)
+            return nombre
+
+    def ajouter_ligne(self, produit_id, matiere_id, quantite, par=None):
+        m = self.magasin
+        with m.verrou:
+            lignes = {**self.lignes.get(produit_id, {}), None: (matiere_id, float(quantite))}
+            m.ecrire_lot([{"op": "ajouter", "table": "nomenclatures", "valeurs": {
+                "Produit_ID": produit_id, "Matiere_ID": matiere_id, "Quantité": quantite,
+            }}] + self.operations_couts(produit_id, lignes), par=par)
+
+    def supprimer_ligne(self, ligne_id, par=None):
+        m = self.magasin
+        with m.verrou:
+            produit_id = int(m.ligne("nomenclatures", ligne_id)["Produit_ID"])
+            lignes = {i: l for i, l in self.lignes.get(produit_id, {}).items() if i != ligne_id}
+            m.ecrire_lot([{"op": "supprimer", "table": "nomenclatures", "id": ligne_id}]
+                         + self.operations_couts(produit_id, lignes), par=par)
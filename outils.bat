@@ -0,0 +1,11 @@
+@echo off
+setlocal
+
+:: Outil en ligne de commande, par ex. depuis le Planificateur de tâches :
+::   outils.bat verifier
+::   outils.bat exporter exports\ventes.csv --du 2025-01-01
+set PYTHON=C:\Python313\python.exe
+
+cd /d "%~dp0"
+%PYTHON% outils.py %*
+exit /b %errorlevel%
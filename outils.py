@@ -0,0 +1,176 @@
+import argparse
+import os
+import sys
+from itertools import islice
+
+import pandas as pd
+
+from audit import FICHIER_AUDIT, JournalAudit
+from boutiques import Boutiques
+from cubes import Entrepot
+from integrite import controler
+from stockage import CANAUX, TABLES, Magasin, MagasinOccupe
+from variantes import operations_stock, variantes_valides
+
+# ==============================
+# OUTIL EN LIGNE DE COMMANDE
+# ==============================
+# Opérations en masse sans passer par l'interface, avec le même code que
+# l'application (magasin, journal, audit, entrepôt). Utilisable depuis cron ou le
+# Planificateur de tâches Windows (voir outils.bat) :
+#
+#     python outils.py importer ventes_2024.csv --stock
+#     python outils.py exporter ventes_t1.csv --du 2025-01-01 --au 2025-03-31
+#     python outils.py reconstruire
+#     python outils.py compacter --age 0
+#     python outils.py verifier
+#
+# Les commandes qui écrivent prennent le verrou du magasin : elles refusent
+# de tourner pendant que l'application a ouvert la même boutique. Export et
+# vérification lisent en lecture seule et peuvent tourner à tout moment.
+# Code de sortie : 0 si tout va bien, 1 si des anomalies sont trouvées,
+# 2 si le magasin est occupé.
+
+TAILLE_LOT = 5000
+
+
+def lire_par_blocs(chemin, taille):
+    """DataFrames successifs de `taille` lignes au plus, sans charger tout le fichier."""
+    if chemin.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        classeur = load_workbook(chemin, read_only=True, data_only=True)
+        lignes = classeur.active.iter_rows(values_only=True)
+        entete = list(next(lignes))
+        while bloc := list(islice(lignes, taille)):
+            yield pd.DataFrame(bloc, columns=entete)
+        classeur.close()
+    else:
+        yield from pd.read_csv(chemin, chunksize=taille)
+
+
+def lire_dates(serie):
+    """Dates ISO (celles des exports) telles quelles ; les autres formats sont lus
+    jour en premier. Une date ISO invalide (2025-13-01) reste invalide."""
+    iso = serie.astype(str).str.strip().str.match(r"\d{4}-")
+    dates = pd.to_datetime(serie.where(iso), errors="coerce", format="ISO8601")
+    autres = ~iso & serie.notna()
+    if autres.any():
+        dates[autres] = pd.to_datetime(serie[autres], errors="coerce", format="mixed", dayfirst=True)
+    return dates
+
+
+def importer(m, chemin, stock=False, taille=TAILLE_LOT):
+    """Ajoute les ventes du fichier, un lot d'écriture par bloc.
+
+    Colonnes : Date, Quantité, Canal, Produit_ID ou Produit (nom) et, pour
+    un produit qui a des variantes, Variante_ID. Les lignes d'un produit ou
+    d'une variante inconnus, sans date valide, d'une quantité qui n'est pas
+    un entier positif ou d'un canal inconnu sont ignorées (et comptées),
+    avant toute écriture du bloc. Avec `stock`, les quantités sont retirées
+    du stock des produits et de leurs variantes.
+    """
+    produits = m.df("produits")
+    par_nom = dict(zip(produits["Nom"], produits["ID"]))
+    connus = set(produits["ID"].tolist())
+    importees = ignorees = 0
+    for bloc in lire_par_blocs(chemin, taille):
+        if "Produit_ID" not in bloc:
+            bloc["Produit_ID"] = bloc["Produit"].map(par_nom)
+        quantites = pd.to_numeric(bloc["Quantité"], errors="coerce")
+        variante = pd.to_numeric(bloc.get("Variante_ID", pd.Series(0, index=bloc.index)), errors="coerce").fillna(0)
+        bloc = bloc.assign(Date=lire_dates(bloc["Date"]).dt.strftime("%Y-%m-%d"), Quantité=quantites,
+                           Variante_ID=variante.astype(int))
+        valides = (bloc["Produit_ID"].isin(connus) & bloc["Date"].notna() & (quantites > 0)
+                   & (quantites % 1 == 0) & bloc["Canal"].isin(CANAUX)
+                   & variantes_valides(m, bloc["Produit_ID"], variante))
+        ignorees += int((~valides).sum())
+        bloc = bloc[valides]
+        if bloc.empty:
+            continue
+        operations = [{"op": "ajouter", "table": "ventes", "valeurs": {
+            "Date": d, "Produit_ID": int(p), "Quantité": int(q), "Canal": c, "Commande_ID": 0, "Variante_ID": v,
+        }} for d, p, q, c, v in zip(bloc["Date"], bloc["Produit_ID"], bloc["Quantité"], bloc["Canal"],
+                                    bloc["Variante_ID"])]
+        if stock:
+            sorties = bloc.groupby(["Produit_ID", "Variante_ID"])["Quantité"].sum()
+            operations += operations_stock(m, {(int(p), int(v)): -int(q) for (p, v), q in sorties.items()})
+        m.ecrire_lot(operations, par="outils")
+        importees += len(bloc)
+        print(f"  {importees} ventes importées", flush=True)
+    return importees, ignorees
+
+
+def exporter(m, sortie, table="ventes", du=None, jusqu_a=None):
+    df = m.df(table)
+    if "Date" in df and (du or jusqu_a):
+        dates = df["Date"].astype(str)
+        df = df[(dates >= (du or "")) & (dates <= (jusqu_a or "9999"))]
+    if table == "ventes":
+        produits = m.df("produits")
+        df = df.assign(Produit=df["Produit_ID"].map(dict(zip(produits["ID"], produits["Nom"]))))
+    if sortie.lower().endswith(".xlsx"):
+        df.to_excel(sortie, index=False)
+    else:
+        df.to_csv(sortie, index=False, chunksize=TAILLE_LOT)
+    return len(df)
+
+
+def main(arguments=None):
+    parseur = argparse.ArgumentParser(description="Opérations en masse sur les données des caftans")
+    parseur.add_argument("--boutique", default="principale", help="code de la boutique (défaut : principale)")
+    commandes = parseur.add_subparsers(dest="commande", required=True)
+    p = commandes.add_parser("importer", help="importer un fichier de ventes (CSV ou Excel)")
+    p.add_argument("fichier")
+    p.add_argument("--stock", action="store_true", help="retirer les quantités du stock")
+    p.add_argument("--taille-lot", type=int, default=TAILLE_LOT)
+    p = commandes.add_parser("exporter", help="exporter une table sur une période")
+    p.add_argument("sortie", help="fichier .csv ou .xlsx")
+    p.add_argument("--table", default="ventes", choices=list(TABLES))
+    p.add_argument("--du", help="AAAA-MM-JJ")
+    p.add_argument("--au", help="AAAA-MM-JJ")
+    commandes.add_parser("reconstruire", help="rejouer le journal, réécrire les fichiers et recalculer les agrégats")
+    p = commandes.add_parser("compacter", help="purger les lignes supprimées et le journal")
+    p.add_argument("--age", type=int, help="âge minimal des suppressions en secondes (défaut : délai d'annulation)")
+    commandes.add_parser("verifier", help="contrôler l'intégrité des données")
+    args = parseur.parse_args(arguments)
+
+    lecture_seule = args.commande in ("exporter", "verifier")
+    dossier = Boutiques().dossier(args.boutique)
+    try:
+        m = Magasin(dossier).ouvrir(lecture_seule=lecture_seule)
+    except MagasinOccupe as exc:
+        print(f"{exc} : fermez l'application avant de lancer « {args.commande} ».", file=sys.stderr)
+        return 2
+    if not lecture_seule:  # mêmes traces d'audit que les écritures de l'application
+        m.abonner(JournalAudit(os.path.join(dossier, FICHIER_AUDIT)).suivre)
+
+    try:
+        if args.commande == "importer":
+            importees, ignorees = importer(m, args.fichier, args.stock, args.taille_lot)
+            print(f"{importees} ventes importées, {ignorees} lignes ignorées (produit, variante, date, quantité ou canal invalide)")
+        elif args.commande == "exporter":
+            print(f"{exporter(m, args.sortie, args.table, args.du, args.au)} lignes écrites dans {args.sortie}")
+        elif args.commande == "reconstruire":
+            frames, _ = m.instantane()
+            m.sales.update(frames)  # réécrit tous les fichiers Excel au prochain vidage
+            entrepot = Entrepot.construire(frames["ventes"], frames["produits"], frames["charges"],
+                                           avancer=lambda p, msg="": print(f"  {p:.0%} {msg}", flush=True))
+            print(entrepot.synthese("Année").to_string(index=False))
+        elif args.commande == "compacter":
+            purges = m.compacter(args.age)
+            print(", ".join(f"{nom} : {n} ligne(s) purgée(s)" for nom, n in purges.items()) or "Rien à purger")
+        else:
+            resultats = controler(m.instantane()[0])
+            if resultats.empty:
+                print("Aucune anomalie.")
+            else:
+                print(resultats.to_string(index=False))
+                return 1
+    finally:
+        if not lecture_seule:
+            m.fermer()  # vidage : fichiers Excel à jour et journal purgé
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from cubes import INCONNU
+
+# ==============================
+# PRÉVISIONS DES VENTES
+# ==============================
+# Modèles saisonniers sur les séries mensuelles lues dans le cube :
+# Holt-Winters additif quand l'historique couvre au moins deux années,
+# sinon saisonnier naïf (le même mois l'an passé), sinon lissage
+# exponentiel simple. Les pics annuels (mariages, Ramadan) sont portés par
+# la composante saisonnière ; le Ramadan avançant d'environ 11 jours par an,
+# il n'est capté qu'approximativement par une saison de 12 mois.
+#
+# Les paramètres sont choisis sur une grille : toutes les combinaisons sont
+# évaluées ensemble, la boucle sur les mois étant vectorisée sur la grille.
+
+SAISON = 12
+HORIZON = 6
+GRILLE = np.array([0.1, 0.3, 0.5, 0.7, 0.9])
+
+
+def series_mensuelles(entrepot, mesure="Quantité"):
+    """Matrice produits × mois (mois sans vente à 0), lue dans le cube."""
+    df = entrepot.ventes.requete({"Date": "Mois", "Produit": "Produit"})
+    df = df[df["Date"] != INCONNU]
+    if df.empty:
+        return pd.DataFrame()
+    mois = pd.period_range(df["Date"].min(), df["Date"].max(), freq="M").astype(str)
+    return df.pivot_table(index="Produit", columns="Date", values=mesure, aggfunc="sum", fill_value=0) \
+        .reindex(columns=mois, fill_value=0)
+
+
+def mois_suivants(dernier, horizon=HORIZON):
+    return pd.period_range(pd.Period(dernier, freq="M") + 1, periods=horizon, freq="M").astype(str).tolist()
+
+
+def lissage_simple(y, horizon):
+    """Lissage exponentiel simple : prévision plate au dernier niveau."""
+    alpha = GRILLE
+    niveau = np.full(len(alpha), y[0])
+    erreurs = np.zeros(len(alpha))
+    for valeur in y[1:]:
+        erreurs += (valeur - niveau) ** 2
+        niveau = alpha * valeur + (1 - alpha) * niveau
+    meilleur = erreurs.argmin()
+    return np.full(horizon, niveau[meilleur]), np.sqrt(erreurs[meilleur] / max(1, len(y) - 1))
+
+
+def saisonnier_naif(y, horizon, saison=SAISON):
+    prevision = np.array([y[len(y) - saison + h % saison] for h in range(horizon)], dtype=float)
+    ecarts = y[saison:] - y[:-saison]
+    return prevision, np.sqrt(np.mean(ecarts ** 2)) if len(ecarts) else np.nan
+
+
+def holt_winters(y, horizon, saison=SAISON):
+    """Holt-Winters additif ; renvoie la prévision et l'erreur quadratique à un pas."""
+    alpha, beta, gamma = (g.ravel() for g in np.meshgrid(GRILLE, GRILLE[:3], GRILLE, indexing="ij"))
+    niveau = np.full(len(alpha), y[:saison].mean())
+    tendance = np.full(len(alpha), (y[saison:2 * saison].mean() - y[:saison].mean()) / saison)
+    saisons = np.tile(y[:saison] - y[:saison].mean(), (len(alpha), 1))
+    erreurs = np.zeros(len(alpha))
+    for t in range(saison, len(y)):
+        s = saisons[:, t % saison]
+        erreurs += (y[t] - (niveau + tendance + s)) ** 2
+        nouveau = alpha * (y[t] - s) + (1 - alpha) * (niveau + tendance)
+        tendance = beta * (nouveau - niveau) + (1 - beta) * tendance
+        saisons[:, t % saison] = gamma * (y[t] - nouveau) + (1 - gamma) * s
+        niveau = nouveau
+    m = erreurs.argmin()
+    n = len(y)
+    prevision = np.array([niveau[m] + h * tendance[m] + saisons[m, (n + h - 1) % saison]
+                          for h in range(1, horizon + 1)])
+    return prevision, np.sqrt(erreurs[m] / (n - saison))
+
+
+def prevoir(serie, horizon=HORIZON, saison=SAISON):
+    """Prévision d'une série mensuelle (pd.Series indexée par mois « AAAA-MM »).
+
+    Renvoie {"methode", "mois", "prevision", "erreur"} ; les ventes ne pouvant
+    être négatives, la prévision est bornée à 0.
+    """
+    y = serie.to_numpy(dtype=float)
+    if len(y) >= 2 * saison:
+        methode, (prevision, erreur) = "Holt-Winters", holt_winters(y, horizon, saison)
+    elif len(y) >= saison:
+        methode, (prevision, erreur) = "Saisonnier naïf", saisonnier_naif(y, horizon, saison)
+    else:
+        methode, (prevision, erreur) = "Lissage simple", lissage_simple(y, horizon)
+    return {"methode": methode, "mois": mois_suivants(serie.index[-1], horizon),
+            "prevision": np.clip(prevision, 0, None), "erreur": erreur}
+
+
+def prevoir_tout(entrepot, avancer=None, horizon=HORIZON):
+    """Prévisions du revenu total et des quantités de chaque produit.
+
+    Renvoie {"historique": {clé: série}, "previsions": {clé: prévision}},
+    la clé "Total" désignant le revenu de toute la boutique.
+    """
+    quantites = series_mensuelles(entrepot, "Quantité")
+    if quantites.empty:
+        return {"historique": {}, "previsions": {}}
+    historique = {"Total": series_mensuelles(entrepot, "Revenu").sum()}
+    historique.update((produit, ligne) for produit, ligne in quantites.iterrows())
+    previsions = {}
+    for i, (cle, serie) in enumerate(historique.items()):
+        if avancer and i % 50 == 0:
+            avancer(i / len(historique), f"{i} / {len(historique)} séries")
+        previsions[cle] = prevoir(serie, horizon)
+    return {"historique": historique, "previsions": previsions}
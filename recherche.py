@@ -0,0 +1,116 @@
+import heapq
+import unicodedata
+from collections import Counter, defaultdict
+
+# ==============================
+# RECHERCHE PAR TRIGRAMMES
+# ==============================
+# Chaque ligne est réduite à un texte (nom du produit, catégorie de la
+# charge, date / canal / produit de la vente) découpé en trigrammes, sans
+# casse ni accents. Une recherche ne lit que les listes des trigrammes de la
+# requête : elle reste de l'ordre de la milliseconde et tolère les fautes de
+# frappe. Les index sont tenus à jour par abonnement au magasin.
+
+SEUIL = 0.3  # part minimale des trigrammes de la requête présents dans le texte
+
+
+def normaliser(texte):
+    texte = unicodedata.normalize("NFKD", str(texte).lower())
+    return "".join(c for c in texte if not unicodedata.combining(c))
+
+
+def trigrammes(texte):
+    return {f"  {mot} "[i:i + 3] for mot in normaliser(texte).split() for i in range(len(mot) + 2)}
+
+
+class IndexTexte:
+    def __init__(self):
+        self.documents = {}  # ID -> (texte normalisé, nombre de trigrammes)
+        self.listes = defaultdict(set)  # trigramme -> IDs
+
+    def ajouter(self, identifiant, texte):
+        self.retirer(identifiant)
+        grammes = trigrammes(texte)
+        self.documents[identifiant] = (normaliser(texte), len(grammes))
+        for g in grammes:
+            self.listes[g].add(identifiant)
+
+    def retirer(self, identifiant):
+        document = self.documents.pop(identifiant, None)
+        if document is not None:
+            for g in trigrammes(document[0]):
+                self.listes[g].discard(identifiant)
+
+    def chercher(self, requete, limite=20):
+        """IDs les plus proches de la requête, meilleur d'abord."""
+        texte = normaliser(requete).strip()
+        grammes = trigrammes(texte)
+        if not grammes:
+            return []
+        communs = Counter()
+        for g in grammes:
+            communs.update(self.listes.get(g, ()))
+        scores = {}
+        for identifiant, n in communs.items():
+            if n < SEUIL * len(grammes):
+                continue
+            document, taille = self.documents[identifiant]
+            # Similarité de Jaccard, et priorité aux textes qui contiennent la requête telle quelle
+            scores[identifiant] = n / (len(grammes) + taille - n) + (texte in document)
+        return heapq.nlargest(limite, scores, key=scores.get)
+
+
+def textes(table, df, noms_produits):
+    """Texte indexé de chaque ligne d'une table, calculé colonne par colonne."""
+    if table == "produits":
+        return df["Nom"].astype(str)
+    if table == "charges":
+        return df["Catégorie"].astype(str) + " " + df["Type"].astype(str) + " " + df["Date"].astype(str)
+    return (df["ID"].astype(str) + " " + df["Date"].astype(str) + " " + df["Canal"].astype(str) + " "
+            + df["Produit_ID"].map(noms_produits).fillna("").astype(str))
+
+
+class Recherche:
+    """Index des tables d'un magasin, construits au premier usage puis suivis par abonnement."""
+
+    def __init__(self, magasin):
+        self.magasin = magasin
+        self.index = {}
+        magasin.abonner(self.suivre)
+
+    def _noms_produits(self):
+        produits = self.magasin.df("produits")
+        return dict(zip(produits["ID"], produits["Nom"]))
+
+    def _index(self, table):
+        # Sous le verrou du magasin, comme les abonnés : une seule règle d'ordre des verrous
+        with self.magasin.verrou:
+            if table not in self.index:
+                df = self.magasin.df(table)
+                noms = self._noms_produits() if table == "ventes" else None
+                index = IndexTexte()
+                for identifiant, texte in zip(df["ID"].tolist(), textes(table, df, noms)):
+                    index.ajouter(identifiant, texte)
+                self.index[table] = index
+            return self.index[table]
+
+    def chercher(self, table, requete, limite=20):
+        index = self._index(table)
+        with self.magasin.verrou:
+            return index.chercher(requete, limite)
+
+    def suivre(self, operation, avant, apres):
+        table = operation["table"]
+        if table in self.index:
+            if apres is None:
+                self.index[table].retirer(operation["id"])
+            else:
+                noms = self._noms_produits() if table == "ventes" else None
+                self.index[table].ajouter(operation["id"], textes(table, apres.to_frame().T, noms).iloc[0])
+        # Un produit renommé change le texte de ses ventes
+        if table == "produits" and "ventes" in self.index and avant is not None and apres is not None \
+                and avant["Nom"] != apres["Nom"]:
+            ventes = self.magasin.df("ventes")
+            ventes = ventes[ventes["Produit_ID"] == operation["id"]]
+            for identifiant, texte in zip(ventes["ID"].tolist(), textes("ventes", ventes, {operation["id"]: apres["Nom"]})):
+                self.index["ventes"].ajouter(identifiant, texte)
@@ -0,0 +1,593 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from collections import Counter
+from itertools import groupby
+
+import pandas as pd
+
+# Copie à l'écriture (par défaut à partir de pandas 3) : les vues partagées
+# entre sessions ne sont jamais modifiées par une session qui les retravaille.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# ==============================
+# FICHIERS ET SCHÉMAS
+# ==============================
+FICHIER_PRODUITS = "produits.xlsx"
+FICHIER_VENTES = "ventes.xlsx"
+FICHIER_CHARGES = "charges.xlsx"
+FICHIER_COMMANDES = "commandes.xlsx"
+FICHIER_VARIANTES = "variantes.xlsx"
+FICHIER_MATIERES = "matieres.xlsx"
+FICHIER_NOMENCLATURES = "nomenclatures.xlsx"
+FICHIER_JOURNAL = "journal.jsonl"
+FICHIER_POINT_CONTROLE = "journal.checkpoint"
+FICHIER_VERROU = "magasin.lock"
+
+TABLES = {
+    # Archivé : produit retiré du catalogue, conservé pour l'historique de ses ventes
+    "produits": (FICHIER_PRODUITS, ["ID", "Nom", "Prix vente", "Tissu", "Main-d'œuvre", "Accessoires", "Stock",
+                                    "Archivé"]),
+    # Commande_ID : en-tête de la commande dont la vente est une ligne (0 : vente isolée)
+    # Variante_ID : 0 pour un produit vendu sans variante
+    "ventes": (FICHIER_VENTES, ["ID", "Date", "Produit_ID", "Quantité", "Canal", "Commande_ID", "Variante_ID"]),
+    "charges": (FICHIER_CHARGES, ["ID", "Date", "Catégorie", "Montant", "Type"]),
+    # Capture_ID : UUID du ticket saisi hors ligne (capture.py), pour ignorer les doublons
+    "commandes": (FICHIER_COMMANDES, ["ID", "Date", "Canal", "Client", "Capture_ID"]),
+    # Taille, couleur... : prix et coûts sont ceux du produit
+    "variantes": (FICHIER_VARIANTES, ["ID", "Produit_ID", "Libellé", "Stock"]),
+    # Prix unitaire : au mètre pour un tissu, à la pièce pour un accessoire
+    "matieres": (FICHIER_MATIERES, ["ID", "Nom", "Type", "Prix unitaire"]),
+    # Une ligne par matière consommée par un produit
+    "nomenclatures": (FICHIER_NOMENCLATURES, ["ID", "Produit_ID", "Matiere_ID", "Quantité"]),
+}
+
+# Valeurs admises des colonnes à choix
+CANAUX = ("Boutique", "En ligne", "Marché")
+TYPES_CHARGE = ("Fixe", "Variable")
+TYPES_MATIERE = ("Tissu", "Accessoire")
+
+logger = logging.getLogger(__name__)
+
+
+def charger_fichier(nom, colonnes):
+    try:
+        df = pd.read_excel(nom)
+        for col in colonnes:
+            if col not in df.columns:
+                df[col] = 0
+        return df
+    except FileNotFoundError:
+        return pd.DataFrame(columns=colonnes)
+
+
+def ecrire_atomique(chemin, ecrire):
+    """Écrit via un fichier temporaire puis le substitue d'un seul coup :
+    un arrêt brutal laisse l'ancien fichier intact, jamais un fichier tronqué."""
+    dossier = os.path.dirname(os.path.abspath(chemin))
+    descripteur, temporaire = tempfile.mkstemp(dir=dossier, prefix=".tmp-", suffix=os.path.splitext(chemin)[1])
+    os.close(descripteur)
+    try:
+        ecrire(temporaire)
+        with open(temporaire, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(temporaire, chemin)
+    except BaseException:
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+        raise
+    if hasattr(os, "O_DIRECTORY"):  # POSIX : rendre le renommage durable
+        fd = os.open(dossier, os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class MagasinOccupe(RuntimeError):
+    """Le magasin est déjà ouvert en écriture par un autre processus."""
+
+
+# Verrous de fichier tenus par ce processus : chemin -> (fichier, nombre de détenteurs)
+_verrous = {}
+_verrou_verrous = threading.Lock()
+
+
+def verrouiller(chemin):
+    """Verrou exclusif entre processus (l'application, l'outil en ligne de
+    commande) ; réentrant dans un même processus. Libéré à sa mort."""
+    chemin = os.path.abspath(chemin)
+    with _verrou_verrous:
+        if chemin in _verrous:
+            fichier, nombre = _verrous[chemin]
+            _verrous[chemin] = (fichier, nombre + 1)
+            return
+        fichier = open(chemin, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(fichier.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fichier.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fichier.close()
+            raise MagasinOccupe(f"Données déjà ouvertes par un autre programme ({chemin})") from None
+        _verrous[chemin] = (fichier, 1)
+
+
+def deverrouiller(chemin):
+    chemin = os.path.abspath(chemin)
+    with _verrou_verrous:
+        fichier, nombre = _verrous.pop(chemin, (None, 0))
+        if nombre > 1:
+            _verrous[chemin] = (fichier, nombre - 1)
+        elif fichier is not None:
+            fichier.close()  # libère le verrou
+
+
+def ecrire_json(chemin, contenu):
+    with open(chemin, "w", encoding="utf-8") as f:
+        json.dump(contenu, f)
+
+
+def valeur_json(valeur):
+    if hasattr(valeur, "item"):  # scalaires numpy
+        valeur = valeur.item()
+    if isinstance(valeur, pd.Timestamp):
+        return valeur.strftime("%Y-%m-%d")
+    if valeur is not None and not isinstance(valeur, str) and pd.isna(valeur):
+        return None
+    return valeur
+
+
+# ==============================
+# MAGASIN EN MÉMOIRE + JOURNAL D'ÉCRITURE ANTICIPÉE
+# ==============================
+# Chaque modification reçoit un numéro de séquence (LSN), est ajoutée au
+# journal et synchronisée sur disque (fsync) avant d'être appliquée en
+# mémoire. Les fichiers Excel, réécrits de façon atomique, servent de point
+# de contrôle : le vidage périodique (ou à l'arrêt) y reporte toutes les
+# modifications depuis le précédent, enregistre le dernier LSN reporté puis
+# retire ces entrées du journal.
+#
+# Au démarrage, seules les entrées postérieures au point de contrôle sont
+# rejouées, en un seul passage par table : la reprise dépend de la taille
+# du journal, pas de celle des données. Une dernière ligne tronquée par un
+# arrêt brutal pendant l'ajout est ignorée.
+#
+# Les DataFrames ne sont jamais modifiés sur place : chaque écriture
+# produit un nouveau DataFrame, ce qui permet au vidage de travailler
+# sur un instantané sans copie ni verrou prolongé. Les ajouts sont mis de
+# côté et concaténés en une fois à la lecture suivante : une saisie coûte
+# le même temps quelle que soit la taille de la table.
+#
+# Une suppression ne retire pas la ligne : elle pose une « pierre tombale »
+# (ID -> date), en O(1). Les lectures et les fichiers Excel n'en voient pas
+# moins la ligne disparaître ; tant que la pierre tombale existe, la
+# suppression peut être annulée (`restaurer`). Le compactage périodique
+# retire physiquement les lignes supprimées depuis plus de `delai_annulation`.
+
+class Magasin:
+    def __init__(self, dossier=".", tables=TABLES, journal=FICHIER_JOURNAL, point_controle=FICHIER_POINT_CONTROLE,
+                 delai_vidage=10, delai_annulation=600):
+        """`dossier` : dossier de la partition (boutique) ; tous les fichiers y sont lus et écrits."""
+        self.dossier = dossier
+        self.tables = {nom: (os.path.join(dossier, fichier), colonnes) for nom, (fichier, colonnes) in tables.items()}
+        self.chemin_journal = os.path.join(dossier, journal)
+        self.chemin_point_controle = os.path.join(dossier, point_controle)
+        self.chemin_verrou = os.path.join(dossier, FICHIER_VERROU)
+        self.delai_vidage = delai_vidage
+        self.delai_annulation = delai_annulation  # secondes
+        self.frames = {}  # lignes physiques, y compris celles supprimées non compactées
+        self.ajouts = {}  # table -> lignes ajoutées, pas encore concaténées à frames
+        self.positions = {}  # table -> {ID: position dans frames}
+        self.tombes = {}  # table -> {ID supprimé: horodatage}
+        self.versions = {}  # table -> compteur de modifications
+        self.vues = {}  # table -> (version, DataFrame visible)
+        self.compteurs = {}  # (table, colonne) -> Counter des valeurs sur les lignes visibles
+        self.prochains_ids = {}
+        # Prochains IDs du dernier point de contrôle : les lignes supprimées
+        # n'étant plus dans les fichiers, leur ID ne doit pas être réattribué
+        self.ids_sauves = {}
+        self.sales = set()  # tables modifiées depuis le dernier vidage
+        self.lsn = 0  # dernier numéro de séquence attribué
+        self.version = 0
+        self.abonnes = []
+        self.verrou = threading.RLock()
+        self.verrou_vidage = threading.Lock()
+        self.arret = threading.Event()
+        self.journal = None
+        self.thread = None
+
+    # --- Ouverture / reprise / fermeture ---
+    def ouvrir(self, lecture_seule=False):
+        """Les tables sont chargées à leur premier accès, sauf celles qui ont
+        des entrées à rejouer : une session qui ne lit pas les charges ne
+        charge jamais charges.xlsx.
+
+        Un seul processus à la fois ouvre le magasin en écriture (MagasinOccupe
+        sinon). En lecture seule, fichiers et journal sont lus sans être
+        modifiés, même pendant que l'application tourne ; toute écriture échoue.
+        """
+        if not lecture_seule:
+            verrouiller(self.chemin_verrou)
+        try:
+            self.lsn = self._lire_point_controle()
+            operations = [op for op in self._lire_journal() if op["lsn"] > self.lsn]
+            for nom in {op["table"] for op in operations}:
+                self._charger(nom)
+            if operations:
+                self._appliquer(operations)
+            self.lsn = operations[-1]["lsn"] if operations else self.lsn
+            if lecture_seule:
+                return self
+            # Réécrit le journal sans les entrées déjà reportées ni une fin tronquée
+            self._reecrire_journal(operations)
+        except BaseException:
+            if not lecture_seule:
+                deverrouiller(self.chemin_verrou)
+            raise
+        self.journal = open(self.chemin_journal, "a", encoding="utf-8")
+        self.thread = threading.Thread(target=self._boucle_vidage, name="vidage-excel", daemon=True)
+        self.thread.start()
+        atexit.register(self.fermer)
+        return self
+
+    def fermer(self):
+        if self.journal is None:
+            return
+        self.arret.set()
+        self.vider()
+        with self.verrou:
+            self.journal.close()
+            self.journal = None
+        deverrouiller(self.chemin_verrou)
+
+    def _lire_point_controle(self):
+        if not os.path.exists(self.chemin_point_controle):
+            return 0
+        with open(self.chemin_point_controle, encoding="utf-8") as f:
+            point = json.load(f)
+        self.ids_sauves = point.get("prochains_ids", {})
+        return point["lsn"]
+
+    def _lire_journal(self):
+        if not os.path.exists(self.chemin_journal):
+            return []
+        operations = []
+        with open(self.chemin_journal, "rb") as f:
+            lignes = f.read().split(b"\n")
+        for numero, ligne in enumerate(lignes):
+            if not ligne.strip():
+                continue
+            try:
+                operations.append(json.loads(ligne))
+            except ValueError:
+                if numero < len(lignes) - 1:  # corruption au milieu : ne pas deviner
+                    raise
+                logger.warning("Dernière entrée du journal tronquée, ignorée")
+        return operations
+
+    def abonner(self, fonction):
+        """`fonction(operation, avant, apres)` est appelée sous le verrou après chaque
+        écriture, avec l'entrée du journal (table, id, op, auteur, horodatage) et la
+        ligne avant et après (None pour un ajout / une suppression)."""
+        self.abonnes.append(fonction)
+
+    def _charger(self, nom):
+        with self.verrou:
+            if nom in self.frames:
+                return
+            fichier, colonnes = self.tables[nom]
+            self.frames[nom] = charger_fichier(fichier, colonnes)
+            self.tombes[nom] = {}
+            self.versions[nom] = 0
+            self._indexer(nom)
+            ids = self.frames[nom]["ID"]
+            self.prochains_ids[nom] = max(int(ids.max()) + 1 if not ids.empty else 1, self.ids_sauves.get(nom, 1))
+
+    def chargee(self, nom):
+        return nom in self.frames
+
+    def _fusionner(self, nom):
+        """Concatène les lignes ajoutées depuis la dernière lecture : une saisie
+        ne coûte qu'un ajout à une liste, la copie de la table n'est payée
+        qu'une fois, par la lecture suivante."""
+        ajouts = self.ajouts.pop(nom, None)
+        if ajouts:
+            self.frames[nom] = pd.concat([self.frames[nom], pd.DataFrame(ajouts)], ignore_index=True)
+
+    def _indexer(self, nom):
+        self.positions[nom] = dict(zip(self.frames[nom]["ID"].tolist(), range(len(self.frames[nom]))))
+
+    # --- Lecture ---
+    def df(self, nom):
+        """Lignes visibles de la table (sans les supprimées).
+
+        Calculé une fois par version de la table puis partagé par toutes les
+        sessions. Chaque appel renvoie une copie superficielle : les données
+        ne sont pas dupliquées, et une session qui ajoute ou modifie une
+        colonne ne copie que celle-ci, sans toucher la version partagée.
+        """
+        with self.verrou:
+            self._charger(nom)
+            vue = self.vues.get(nom)
+            if vue is None or vue[0] != self.versions[nom]:
+                self._fusionner(nom)
+                df = self.frames[nom]
+                if self.tombes[nom]:
+                    df = df[~df["ID"].isin(list(self.tombes[nom]))].reset_index(drop=True)
+                vue = self.vues[nom] = (self.versions[nom], df)
+            return vue[1].copy(deep=False)
+
+    def instantane(self):
+        """Tables et version cohérentes entre elles, pour un recalcul hors verrou."""
+        with self.verrou:
+            return {nom: self.df(nom) for nom in self.tables}, self.version
+
+    def ligne(self, nom, identifiant):
+        """Ligne visible d'ID donné, ou None. O(1) grâce à l'index des positions."""
+        with self.verrou:  # positions, frames et ajouts sont remplacés par la fusion et le compactage
+            self._charger(nom)
+            if identifiant in self.tombes[nom]:
+                return None
+            return self._ligne_physique(nom, identifiant)
+
+    def _ligne_physique(self, nom, identifiant):
+        """Ligne d'ID donné, même supprimée tant qu'elle n'est pas compactée, ou None."""
+        with self.verrou:
+            position = self.positions[nom].get(identifiant)
+            if position is None:
+                return None
+            taille = len(self.frames[nom])
+            if position >= taille:  # ligne encore en attente de concaténation
+                return pd.Series(self.ajouts[nom][position - taille], name=position)
+            return self.frames[nom].iloc[position]
+
+    def compter(self, nom, colonne, valeur):
+        """Nombre de lignes visibles de `nom` où `colonne` vaut `valeur`, en O(1) :
+        l'index est construit au premier appel puis tenu à jour à chaque écriture."""
+        with self.verrou:
+            cle = (nom, colonne)
+            if cle not in self.compteurs:
+                self.compteurs[cle] = Counter(self.df(nom)[colonne].tolist())
+            return self.compteurs[cle][valeur]
+
+    def memoire(self):
+        """Octets occupés par les tables chargées, une seule fois pour tout le processus."""
+        with self.verrou:
+            for nom in self.ajouts.copy():
+                self._fusionner(nom)
+            return {nom: int(df.memory_usage(deep=True).sum()) for nom, df in self.frames.items()}
+
+    def prochain_id(self, nom):
+        with self.verrou:
+            self._charger(nom)
+            return self.prochains_ids[nom]
+
+    # --- Écriture ---
+    # `par` : nom de l'utilisateur à l'origine de la modification
+    def ajouter(self, nom, ligne, par=None):
+        """Ajoute une ligne ; un ID est attribué si la ligne n'en a pas. Renvoie l'ID."""
+        with self.verrou:
+            self._charger(nom)
+            ligne = {"ID": self.prochains_ids[nom], **ligne}
+            self._ecrire({"op": "ajouter", "table": nom, "id": ligne["ID"], "valeurs": ligne}, par)
+            return ligne["ID"]
+
+    def modifier(self, nom, identifiant, valeurs, par=None):
+        with self.verrou:
+            self._ecrire({"op": "modifier", "table": nom, "id": identifiant, "valeurs": valeurs}, par)
+
+    def supprimer(self, nom, identifiant, par=None):
+        with self.verrou:
+            self._ecrire({"op": "supprimer", "table": nom, "id": identifiant}, par)
+
+    def restaurable(self, nom, identifiant):
+        """Vrai si la ligne est supprimée mais pas encore compactée."""
+        with self.verrou:
+            self._charger(nom)
+            return identifiant in self.tombes[nom] and identifiant in self.positions[nom]
+
+    def restaurer(self, nom, identifiant, par=None):
+        """Annule une suppression non encore compactée. Renvoie False si trop tard.
+
+        L'entrée du journal porte la ligne entière, comme un ajout : le vidage
+        ne reporte que les lignes visibles, la reprise doit pouvoir la recréer.
+        """
+        with self.verrou:
+            if not self.restaurable(nom, identifiant):
+                return False
+            self._ecrire({"op": "restaurer", "table": nom, "id": identifiant}, par)
+            return True
+
+    def ecrire_lot(self, operations, par=None):
+        """Écrit plusieurs opérations d'un bloc : une seule synchronisation du
+        journal, puis un seul passage d'application par suite d'opérations
+        consécutives sur la même table, et une seule notification des abonnés
+        par ligne touchée dans cette suite (état avant la suite, état après).
+        Entre deux suites, les abonnés voient donc les autres tables dans
+        l'état où l'ordre des opérations les a laissées. Les « ajouter » sans
+        ID en reçoivent un, les « restaurer » la ligne restaurée. Renvoie les IDs.
+
+        Ex. : [{"op": "ajouter", "table": "ventes", "valeurs": {...}},
+               {"op": "modifier", "table": "produits", "id": 3, "valeurs": {"Stock": 4}}]
+        """
+        if self.journal is None:
+            raise RuntimeError("Magasin ouvert en lecture seule ou fermé")
+        with self.verrou:
+            prochains = {}
+            completes = []
+            for operation in operations:
+                nom = operation["table"]
+                self._charger(nom)
+                if operation["op"] == "ajouter":
+                    prochains.setdefault(nom, self.prochains_ids[nom])
+                    valeurs = {"ID": prochains[nom], **operation["valeurs"]}
+                    prochains[nom] = max(prochains[nom], int(valeurs["ID"])) + 1
+                    operation = {**operation, "id": valeurs["ID"], "valeurs": valeurs}
+                elif operation["op"] == "restaurer" and "valeurs" not in operation:
+                    ligne = self._ligne_physique(nom, operation["id"])
+                    if ligne is not None:
+                        operation = {**operation, "valeurs": ligne.to_dict()}
+                completes.append(operation)
+            horodatage = datetime.now().isoformat(timespec="seconds")
+            lignes = [json.dumps({"lsn": self.lsn + 1 + i, "ts": horodatage, "par": par, **operation},
+                                 default=valeur_json, ensure_ascii=False)
+                      for i, operation in enumerate(completes)]
+            self.journal.write("".join(ligne + "\n" for ligne in lignes))
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.lsn += len(lignes)
+            operations = [json.loads(ligne) for ligne in lignes]
+            for _, suite in groupby(operations, key=lambda op: op["table"]):
+                suite = list(suite)
+                dernieres = {(op["table"], op["id"]): op for op in suite}
+                avants = {cle: self.ligne(*cle) for cle in dernieres}
+                self._appliquer(suite)
+                for cle, operation in dernieres.items():
+                    apres = self.ligne(*cle)
+                    for (nom, colonne), compteur in self.compteurs.items():
+                        if nom == cle[0]:
+                            if avants[cle] is not None:
+                                compteur[avants[cle][colonne]] -= 1
+                            if apres is not None:
+                                compteur[apres[colonne]] += 1
+                    for fonction in self.abonnes:
+                        fonction(operation, avants[cle], apres)
+            return [op["id"] for op in completes]
+
+    def _ecrire(self, operation, par):
+        self.ecrire_lot([operation], par)
+
+    def _appliquer(self, operations):
+        """Applique des opérations du journal en un seul passage par table.
+
+        Les suppressions ne touchent que les pierres tombales. Les autres
+        opérations sont réduites à l'état final de chaque ID puis reportées de
+        façon vectorisée. Un « ajouter » sur un ID existant le remplace :
+        rejouer une opération déjà reportée dans les fichiers Excel est sans
+        effet. Une restauration retire la pierre tombale et, comme un ajout,
+        recrée la ligne si le vidage l'a déjà retirée des fichiers.
+        """
+        par_table = {}
+        for op in operations:
+            etats = par_table.setdefault(op["table"], {})
+            tombes = self.tombes[op["table"]]
+            if op["op"] == "supprimer":
+                tombes[op["id"]] = op.get("ts")
+            elif op["op"] == "restaurer":
+                tombes.pop(op["id"], None)
+                if "valeurs" in op:
+                    etats[op["id"]] = (True, dict(op["valeurs"]))
+            elif op["op"] == "ajouter":
+                tombes.pop(op["id"], None)
+                etats[op["id"]] = (True, dict(op["valeurs"]))
+            else:
+                complete, valeurs = etats.get(op["id"], (False, {}))
+                etats[op["id"]] = (complete, {**valeurs, **op["valeurs"]})
+
+        for nom, etats in par_table.items():
+            positions = self.positions[nom]
+            maj = {i: valeurs for i, (_, valeurs) in etats.items() if i in positions}
+            nouveaux = [valeurs for i, (complete, valeurs) in etats.items() if complete and i not in positions]
+            if maj:
+                self._fusionner(nom)
+                df = self.frames[nom].copy()
+                for col in {c for valeurs in maj.values() for c in valeurs}:
+                    par_id = {i: valeurs[col] for i, valeurs in maj.items() if col in valeurs}
+                    if col not in df:
+                        df[col] = None
+                    cible = df["ID"].isin(list(par_id))
+                    serie = df[col].copy()
+                    try:
+                        serie.loc[cible] = df.loc[cible, "ID"].map(par_id)
+                    except (TypeError, ValueError):  # type incompatible : on élargit la colonne
+                        serie = serie.astype(object)
+                        serie.loc[cible] = df.loc[cible, "ID"].map(par_id)
+                        serie = serie.infer_objects()
+                    df[col] = serie
+                self.frames[nom] = df
+            if nouveaux:
+                # Ajout en O(1) : concaténés à la prochaine lecture (_fusionner)
+                ajouts = self.ajouts.setdefault(nom, [])
+                debut = len(self.frames[nom]) + len(ajouts)
+                ajouts.extend(nouveaux)
+                positions.update((v["ID"], debut + k) for k, v in enumerate(nouveaux))
+                self.prochains_ids[nom] = max(self.prochains_ids[nom], *(int(v["ID"]) + 1 for v in nouveaux))
+            self.versions[nom] += 1
+            self.sales.add(nom)
+        self.version += 1
+
+    def compacter(self, age=None):
+        """Retire physiquement les lignes supprimées depuis plus de `age` secondes.
+
+        Les lignes visibles ne changent pas : rien à journaliser ni à réécrire.
+        Renvoie le nombre de lignes purgées par table.
+        """
+        age = self.delai_annulation if age is None else age
+        limite = (datetime.now() - timedelta(seconds=age)).isoformat(timespec="seconds")
+        purges = {}
+        with self.verrou:
+            for nom, tombes in self.tombes.items():
+                anciennes = [i for i, ts in tombes.items() if ts is None or ts <= limite]
+                if not anciennes:
+                    continue
+                self._fusionner(nom)
+                df = self.frames[nom]
+                self.frames[nom] = df[~df["ID"].isin(anciennes)].reset_index(drop=True)
+                for i in anciennes:
+                    del tombes[i]
+                self._indexer(nom)
+                self.versions[nom] += 1
+                purges[nom] = len(anciennes)
+        return purges
+
+    # --- Vidage vers Excel ---
+    def vider(self):
+        """Point de contrôle : réécrit les fichiers Excel des tables modifiées,
+        puis purge du journal les entrées reportées. Renvoie les tables écrites."""
+        with self.verrou_vidage:
+            with self.verrou:
+                if not self.sales:
+                    return []
+                instantanes = {nom: self.df(nom) for nom in self.sales}
+                lsn = self.lsn
+                prochains = {**self.ids_sauves, **self.prochains_ids}
+                self.sales = set()
+            try:
+                for nom, df in instantanes.items():
+                    ecrire_atomique(self.tables[nom][0], lambda chemin, df=df: df.to_excel(chemin, index=False))
+            except Exception:
+                with self.verrou:
+                    self.sales |= set(instantanes)
+                raise
+            ecrire_atomique(self.chemin_point_controle,
+                            lambda chemin: ecrire_json(chemin, {"lsn": lsn, "prochains_ids": prochains}))
+            self.ids_sauves = prochains
+            with self.verrou:
+                # Ne garde que les entrées postérieures au point de contrôle
+                self.journal.close()
+                self._reecrire_journal([op for op in self._lire_journal() if op["lsn"] > lsn])
+                self.journal = open(self.chemin_journal, "a", encoding="utf-8")
+            return list(instantanes)
+
+    def _reecrire_journal(self, operations):
+        def ecrire(chemin):
+            with open(chemin, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(op, ensure_ascii=False) + "\n" for op in operations)
+        ecrire_atomique(self.chemin_journal, ecrire)
+
+    def _boucle_vidage(self):
+        while not self.arret.wait(self.delai_vidage):
+            try:
+                self.vider()
+                self.compacter()
+            except Exception:
+                logger.exception("Échec du vidage vers Excel, nouvel essai au prochain cycle")
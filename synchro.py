@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+from commandes import operations_commandes
+from stockage import CANAUX
+from variantes import variante_valide
+
+# ==============================
+# SYNCHRONISATION DES VENTES SAISIES HORS LIGNE
+# ==============================
+# Le stand enregistre ses tickets dans une file locale (capture.py), chacun
+# sous un identifiant (UUID) tiré au moment de la saisie. Ils arrivent ici
+# par lots : fichiers JSON déposés dans le dossier « reception » de la
+# boutique, ou envoyés depuis la page Caisse. Chaque lot est écrit en une
+# seule fois ; un ticket dont l'UUID est déjà connu (lot renvoyé après une
+# coupure, fichier copié deux fois) est ignoré.
+#
+# Format, un ticket par ligne :
+# {"uuid": "...", "date": "AAAA-MM-JJ", "canal": "Marché", "client": "",
+#  "lignes": [[ID produit, quantité(, ID variante)], ...]}
+
+DOSSIER_RECEPTION = "reception"
+DOSSIER_TRAITES = "traites"
+
+
+def lire_tickets(texte):
+    return [json.loads(ligne) for ligne in texte.splitlines() if ligne.strip()]
+
+
+def ticket_valide(m, ticket):
+    """Mêmes règles que l'import en masse (outils.importer) : date valide,
+    canal connu, produits et variantes existants, quantités entières positives."""
+    try:
+        datetime.strptime(ticket["date"], "%Y-%m-%d")
+        lignes = [(int(p), float(q), int(v[0]) if v else 0) for p, q, *v in ticket["lignes"]]
+    except (KeyError, TypeError, ValueError):
+        return False
+    return bool(lignes) and ticket.get("canal") in CANAUX and all(
+        q > 0 and q % 1 == 0 and m.ligne("produits", p) is not None and variante_valide(m, p, v)
+        for p, q, v in lignes)
+
+
+class Synchro:
+    def __init__(self, magasin):
+        self.magasin = magasin
+        self.recus = None  # UUIDs déjà enregistrés, lus une fois dans les commandes
+        self.verrou = threading.Lock()  # un seul import à la fois
+
+    def _recus(self):
+        if self.recus is None:
+            self.recus = set(self.magasin.df("commandes")["Capture_ID"].dropna().astype(str))
+        return self.recus
+
+    def importer(self, tickets, par=None):
+        """Enregistre les tickets inconnus en un seul lot.
+
+        Renvoie (importés, doublons, rejetés) ; un ticket invalide (voir
+        `ticket_valide`) est rejeté en entier.
+        """
+        m = self.magasin
+        with self.verrou, m.verrou:
+            recus = self._recus()
+            nouveaux, doublons, rejetes = [], 0, []
+            for ticket in tickets:
+                if ticket["uuid"] in recus or any(t["uuid"] == ticket["uuid"] for t in nouveaux):
+                    doublons += 1
+                elif not ticket_valide(m, ticket):
+                    rejetes.append(ticket)
+                else:
+                    nouveaux.append(ticket)
+            if nouveaux:
+                operations, _ = operations_commandes(m, [{
+                    "lignes": [tuple(int(x) for x in ligne) for ligne in t["lignes"]], "canal": t["canal"],
+                    "client": t.get("client", ""), "date": t["date"], "capture": t["uuid"],
+                } for t in nouveaux])
+                m.ecrire_lot(operations, par=par)
+                recus.update(t["uuid"] for t in nouveaux)
+            return len(nouveaux), doublons, rejetes
+
+    def importer_reception(self, par=None):
+        """Importe puis range les fichiers du dossier de réception de la boutique.
+        Renvoie les totaux (importés, doublons, rejetés) sur tous les fichiers."""
+        reception = os.path.join(self.magasin.dossier, DOSSIER_RECEPTION)
+        traites = os.path.join(reception, DOSSIER_TRAITES)
+        if not os.path.isdir(reception):
+            return 0, 0, []
+        os.makedirs(traites, exist_ok=True)
+        totaux = [0, 0, []]
+        for nom in sorted(os.listdir(reception)):
+            chemin = os.path.join(reception, nom)
+            if not nom.endswith(".jsonl") or not os.path.isfile(chemin):
+                continue
+            with open(chemin, encoding="utf-8") as f:
+                importes, doublons, rejetes = self.importer(lire_tickets(f.read()), par)
+            totaux[0] += importes
+            totaux[1] += doublons
+            totaux[2] += rejetes
+            os.replace(chemin, os.path.join(traites, nom))
+        return tuple(totaux)
@@ -0,0 +1,89 @@
+import itertools
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# ==============================
+# EXÉCUTEUR DE TÂCHES EN ARRIÈRE-PLAN
+# ==============================
+# Les travaux lourds (reconstruction des agrégats, exports Excel, ...) sont
+# confiés à un pool de threads partagé par le processus : la session qui les
+# lance continue de répondre et affiche seulement leur progression.
+# Des threads plutôt que des processus, car les tâches mettent à jour des
+# objets en mémoire (l'entrepôt) partagés avec les sessions.
+
+EN_ATTENTE = "en attente"
+EN_COURS = "en cours"
+TERMINEE = "terminée"
+ECHEC = "échec"
+
+
+class Tache:
+    def __init__(self, identifiant, nom):
+        self.id = identifiant
+        self.nom = nom
+        self.etat = EN_ATTENTE
+        self.progression = 0.0
+        self.message = ""
+        self.resultat = None
+        self.erreur = None
+        self.debut = None
+        self.fin = None
+
+    def avancer(self, progression, message=""):
+        """Appelée par la tâche elle-même : progression entre 0 et 1."""
+        self.progression = max(0.0, min(1.0, progression))
+        if message:
+            self.message = message
+
+    @property
+    def active(self):
+        return self.etat in (EN_ATTENTE, EN_COURS)
+
+
+class Executeur:
+    def __init__(self, nb_threads=2, historique=20):
+        self.pool = ThreadPoolExecutor(max_workers=nb_threads, thread_name_prefix="tache")
+        self.historique = historique
+        self.taches = []
+        self.compteur = itertools.count(1)
+        self.verrou = threading.Lock()
+
+    def soumettre(self, nom, fonction, *args, **kwargs):
+        """Lance `fonction(tache, *args, **kwargs)` en arrière-plan.
+
+        Si une tâche du même nom est déjà active, elle est renvoyée au lieu
+        d'en lancer une seconde (un double clic ne double pas le travail).
+        """
+        with self.verrou:
+            for tache in self.taches:
+                if tache.nom == nom and tache.active:
+                    return tache
+            tache = Tache(next(self.compteur), nom)
+            self.taches.append(tache)
+            terminees = [t for t in self.taches if not t.active]
+            for ancienne in terminees[:max(0, len(self.taches) - self.historique)]:
+                self.taches.remove(ancienne)
+        self.pool.submit(self._executer, tache, fonction, args, kwargs)
+        return tache
+
+    def _executer(self, tache, fonction, args, kwargs):
+        tache.etat = EN_COURS
+        tache.debut = datetime.now()
+        try:
+            tache.resultat = fonction(tache, *args, **kwargs)
+            tache.progression = 1.0
+            tache.etat = TERMINEE
+        except Exception as exc:
+            tache.erreur = f"{exc}\n{traceback.format_exc()}"
+            tache.message = str(exc)
+            tache.etat = ECHEC
+        finally:
+            tache.fin = datetime.now()
+
+    def actives(self):
+        return [t for t in self.taches if t.active]
+
+    def recentes(self):
+        return list(reversed(self.taches))
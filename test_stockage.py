@@ -0,0 +1,42 @@
+from stockage import Magasin, deverrouiller
+
+
+def arret_brutal(m):
+    """Simule la mort du processus : ni vidage ni point de contrôle final."""
+    m.arret.set()
+    m.journal.close()
+    m.journal = None
+    deverrouiller(m.chemin_verrou)
+
+
+def test_restauration_apres_vidage_survit_a_un_arret_brutal(tmp_path):
+    m = Magasin(str(tmp_path), delai_vidage=3600).ouvrir()
+    charge = m.ajouter("charges", {"Date": "2025-03-01", "Catégorie": "Loyer", "Montant": 500, "Type": "Fixe"})
+    m.supprimer("charges", charge)
+    m.vider()  # charges.xlsx ne contient plus la ligne
+    assert m.restaurer("charges", charge)
+    arret_brutal(m)
+
+    m = Magasin(str(tmp_path), delai_vidage=3600).ouvrir()
+    ligne = m.ligne("charges", charge)
+    assert ligne is not None
+    assert (ligne["Catégorie"], ligne["Montant"]) == ("Loyer", 500)
+    m.fermer()
+
+
+def test_restauration_en_lot_rejouee_avec_la_ligne(tmp_path):
+    m = Magasin(str(tmp_path), delai_vidage=3600).ouvrir()
+    produit = m.ajouter("produits", {"Nom": "Caftan", "Stock": 5})
+    vente = m.ajouter("ventes", {"Date": "2025-03-01", "Produit_ID": produit, "Quantité": 2, "Canal": "Boutique"})
+    m.ecrire_lot([{"op": "supprimer", "table": "ventes", "id": vente},
+                  {"op": "modifier", "table": "produits", "id": produit, "valeurs": {"Stock": 7}}])
+    m.vider()
+    m.ecrire_lot([{"op": "restaurer", "table": "ventes", "id": vente},
+                  {"op": "modifier", "table": "produits", "id": produit, "valeurs": {"Stock": 5}}])
+    arret_brutal(m)
+
+    m = Magasin(str(tmp_path), delai_vidage=3600).ouvrir()
+    assert m.ligne("ventes", vente)["Quantité"] == 2
+    assert m.ligne("produits", produit)["Stock"] == 5
+    assert m.prochain_id("ventes") == vente + 1
+    m.fermer()
@@ -0,0 +1,92 @@
+# ==============================
+# VARIANTES (taille, couleur...)
+# ==============================
+# Une variante ne porte que son libellé et son stock : prix et coûts sont
+# ceux du produit, partagés par toutes ses variantes. Une vente porte à la
+# fois le produit et la variante (Variante_ID, 0 si aucune), et le stock du
+# produit reste égal à la somme de celui de ses variantes, corrigé dans le
+# même lot que chaque mouvement : les totaux par produit se lisent donc
+# directement, sans jointure avec la table des variantes.
+
+
+def variantes_produit(m, produit_id):
+    """Variantes visibles d'un produit (DataFrame, vide s'il n'en a pas)."""
+    if not m.compter("variantes", "Produit_ID", produit_id):  # O(1) pour la plupart des produits
+        return m.df("variantes").iloc[0:0]
+    variantes = m.df("variantes")
+    return variantes[variantes["Produit_ID"] == produit_id]
+
+
+def variante_valide(m, produit_id, variante_id):
+    """Vrai si la vente est sans variante pour un produit qui n'en a pas, ou
+    porte une variante de ce produit."""
+    if not variante_id:
+        return not m.compter("variantes", "Produit_ID", produit_id)
+    variante = m.ligne("variantes", variante_id)
+    return variante is not None and variante["Produit_ID"] == produit_id
+
+
+def variantes_valides(m, produits, variantes):
+    """`variante_valide` sur deux séries alignées d'IDs produit et variante (0 si aucune)."""
+    df = m.df("variantes")
+    produit_de = dict(zip(df["ID"].tolist(), df["Produit_ID"].tolist()))
+    return (variantes == 0) & ~produits.isin(set(produit_de.values())) | (variantes.map(produit_de) == produits)
+
+
+def operations_stock(m, mouvements):
+    """Opérations de stock pour `mouvements` : {(ID produit, ID variante): delta}.
+
+    Chaque variante reçoit son delta, chaque produit la somme des siens, en
+    une opération par ligne touchée. À appeler sous le verrou du magasin.
+    """
+    par_produit, operations = {}, []
+    for (produit_id, variante_id), delta in mouvements.items():
+        par_produit[produit_id] = par_produit.get(produit_id, 0) + delta
+        variante = m.ligne("variantes", variante_id) if variante_id else None
+        if variante is not None and delta:
+            operations.append({"op": "modifier", "table": "variantes", "id": variante_id,
+                               "valeurs": {"Stock": int(variante["Stock"]) + delta}})
+    for produit_id, delta in par_produit.items():
+        produit = m.ligne("produits", produit_id)
+        if produit is not None and delta:
+            operations.append({"op": "modifier", "table": "produits", "id": produit_id,
+                               "valeurs": {"Stock": int(produit["Stock"]) + delta}})
+    return operations
+
+
+def ajouter_variante(m, produit_id, libelle, stock, par=None):
+    """Ajoute une variante ; la première remplace le stock global du produit."""
+    with m.verrou:
+        produit = m.ligne("produits", produit_id)
+        total = stock if not m.compter("variantes", "Produit_ID", produit_id) else int(produit["Stock"]) + stock
+        return m.ecrire_lot([
+            {"op": "ajouter", "table": "variantes",
+             "valeurs": {"Produit_ID": produit_id, "Libellé": libelle, "Stock": stock}},
+            {"op": "modifier", "table": "produits", "id": produit_id, "valeurs": {"Stock": total}},
+        ], par=par)[0]
+
+
+def modifier_variante(m, variante_id, libelle, stock, par=None):
+    with m.verrou:
+        variante = m.ligne("variantes", variante_id)
+        operations = [{"op": "modifier", "table": "variantes", "id": variante_id,
+                       "valeurs": {"Libellé": libelle, "Stock": stock}}]
+        produit = m.ligne("produits", variante["Produit_ID"])
+        if produit is not None and stock != variante["Stock"]:
+            operations.append({"op": "modifier", "table": "produits", "id": variante["Produit_ID"],
+                               "valeurs": {"Stock": int(produit["Stock"]) + stock - int(variante["Stock"])}})
+        m.ecrire_lot(operations, par=par)
+
+
+def supprimer_variante(m, variante_id, par=None):
+    """Supprime une variante sans vente et retire son stock du produit.
+    Renvoie le nombre de ventes qui la citent (0 si supprimée)."""
+    with m.verrou:
+        nombre = m.compter("ventes", "Variante_ID", variante_id)
+        if nombre:
+            return nombre
+        variante = m.ligne("variantes", variante_id)
+        operations = [{"op": "supprimer", "table": "variantes", "id": variante_id}]
+        operations += operations_stock(m, {(variante["Produit_ID"], 0): -int(variante["Stock"])})
+        m.ecrire_lot(operations, par=par)
+        return 0